@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+from typing import Any, Optional, Union
+
+import aiohttp
+from iconsdk.builder.call_builder import Call
+from iconsdk.exception import HTTPError
+from iconsdk.utils.converter import convert, get_block_template_to_convert_transactions_for_genesis
+from iconsdk.utils.templates import BLOCK_0_1a, TRANSACTION, TRANSACTION_RESULT
+
+from . import service, transport
+
+DEFAULT_CONCURRENCY = 64
+
+class AsyncService:
+    '''
+    Asyncio counterpart of service.Service for commands sending many
+    requests at once. At most "concurrency" requests are in flight.
+    Results are converted as the methods of IconService with the name,
+    and errors are raised as the exceptions of iconsdk. The block cache
+    of the service is not used.
+
+        async with AsyncService(url, nid) as svc:
+            blocks = await gather(*[ svc.get_block(h) for h in heights ])
+    '''
+    def __init__(self, url: str, nid: int = None, *, concurrency: int = DEFAULT_CONCURRENCY,
+                 timeout: float = None) -> None:
+        if concurrency < 1:
+            raise ValueError(f'InvalidConcurrency({concurrency})')
+        self.__url = url
+        self.__nid = nid
+        self.__concurrency = concurrency
+        self.__timeout = timeout if timeout is not None else transport.get_timeout()
+        self.__limiter = asyncio.Semaphore(concurrency)
+        self.__session: Optional[aiohttp.ClientSession] = None
+        self.__id = 0
+
+    @staticmethod
+    def from_service(svc: service.Service, **kwargs) -> 'AsyncService':
+        return AsyncService(svc.url, svc.nid, **kwargs)
+
+    @property
+    def url(self) -> str:
+        return self.__url
+
+    @property
+    def nid(self) -> Optional[int]:
+        return self.__nid
+
+    def __get_session(self) -> aiohttp.ClientSession:
+        if self.__session is None:
+            keepalive = transport.options['keepalive']
+            if keepalive > 0:
+                connector = aiohttp.TCPConnector(limit=self.__concurrency, keepalive_timeout=keepalive)
+            else:
+                connector = aiohttp.TCPConnector(limit=self.__concurrency, force_close=True)
+            self.__session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.__timeout))
+        return self.__session
+
+    async def close(self):
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    async def __aenter__(self) -> 'AsyncService':
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def request(self, method: str, params: dict = None) -> Any:
+        self.__id += 1
+        req = {
+            'jsonrpc': '2.0',
+            'id': self.__id,
+            'method': method,
+        }
+        if params is not None:
+            req['params'] = params
+        async with self.__limiter:
+            async with self.__get_session().post(self.__url, json=req) as resp:
+                text = await resp.text()
+        try:
+            res = json.loads(text)
+        except ValueError:
+            raise HTTPError(text, resp.status)
+        if not isinstance(res, dict):
+            raise HTTPError(text, resp.status)
+        if 'error' in res:
+            raise service.error_of(res['error'])
+        return res['result']
+
+    async def get_block(self, value: Union[int, str]) -> dict:
+        if value == 'latest':
+            result = await self.request('icx_getLastBlock')
+        elif isinstance(value, int):
+            result = await self.request('icx_getBlockByHeight', { 'height': hex(value) })
+        else:
+            result = await self.request('icx_getBlockByHash', { 'hash': value })
+        template = get_block_template_to_convert_transactions_for_genesis(result, BLOCK_0_1a)
+        return convert(result, template, False)
+
+    async def get_data_by_hash(self, _hash: str) -> str:
+        return await self.request('icx_getDataByHash', { 'hash': _hash })
+
+    async def get_transaction(self, tx_hash: str) -> dict:
+        result = await self.request('icx_getTransactionByHash', { 'txHash': tx_hash })
+        return convert(result, TRANSACTION)
+
+    async def get_transaction_result(self, tx_hash: str) -> dict:
+        result = await self.request('icx_getTransactionResult', { 'txHash': tx_hash })
+        return convert(result, TRANSACTION_RESULT)
+
+    async def call(self, call: Call) -> Any:
+        return await self.request('icx_call', service.call_params(call))
+
+async def gather(*aws) -> list:
+    '''
+    Same as asyncio.gather(), but the others are cancelled when any of
+    them fails, so no request is left running with the closed session.
+    '''
+    tasks = [ asyncio.ensure_future(aw) for aw in aws ]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+def get_instance(url: str = None, nid: int = None, **kwargs) -> AsyncService:
+    '''
+    Returns AsyncService for the network of service.get_instance().
+    It should be called in the event loop using it.
+    '''
+    return AsyncService.from_service(service.get_instance(url, nid), **kwargs)
@@ -4,16 +4,18 @@ import base64
 import io
 import sys
 from datetime import datetime
-from typing import List, Union
+from typing import Iterable, Iterator, List, Optional, Union
 
 import click
 from iconsdk.builder.transaction_builder import (DeployTransactionBuilder,
                                                  TransactionBuilder)
+from iconsdk.exception import JSONRPCException
 from iconsdk.icon_service import SignedTransaction
 from iconsdk.wallet.wallet import Wallet
 
-from . import service, util, wallet, log
+from . import blocktime, service, util, wallet, log
 from .cui import Column, Header, MapPrinter, Row, RowPrinter
+from .prefetch import DEFAULT_THREADS, ordered_map
 
 
 @click.command()
@@ -34,59 +36,96 @@ def get_balance(addr: str, raw: bool = False, height: int = None, icx: bool = Fa
         print(balance)
 
 
+def read_ids(ids: Iterable[str]) -> Iterator[str]:
+    '''
+    Returns IDs in the arguments. "-" is replaced with IDs in stdin
+    (one for each line).
+    '''
+    for id in ids:
+        if id == '-':
+            for line in sys.stdin:
+                line = line.strip()
+                if len(line) > 0:
+                    yield line
+        else:
+            yield id
+
+def threads_option(func):
+    return click.option('--threads', type=click.INT, default=DEFAULT_THREADS,
+                        help='Number of requests to send concurrently')(func)
+
 @click.command()
 @click.argument('ids', nargs=-1)
 @click.option('--raw', '-r', is_flag=True)
-def get_block(ids: List[str], raw: bool = False):
-    '''Get the block information'''
+@threads_option
+def get_block(ids: List[str], raw: bool = False, threads: int = DEFAULT_THREADS):
+    '''Get the block information
+
+    Use "-" to read IDs from stdin.
+    '''
     svc = service.get_instance()
     if len(ids) == 0:
         ids = [ 'latest']
-    for id in ids:
-        blk = svc.get_block(util.ensure_block(id), full_response=raw)
+    fetch = lambda id: svc.get_block(util.ensure_block(id), full_response=raw)
+    for blk in ordered_map(fetch, read_ids(ids), threads=threads):
         util.dump_json(blk if not raw else blk['result'])
 
 @click.command()
 @click.argument('ids', nargs=-1)
 @click.option('--raw', '-r', is_flag=True)
-def get_tx(ids: List[str], raw: bool = False):
-    '''Get the transaction information'''
+@threads_option
+def get_tx(ids: List[str], raw: bool = False, threads: int = DEFAULT_THREADS):
+    '''Get the transaction information
+
+    Use "-" to read IDs from stdin.
+    '''
     svc = service.get_instance()
-    for id in ids:
-        tx = svc.get_transaction(id, full_response=raw)
+    fetch = lambda id: svc.get_transaction(id, full_response=raw)
+    for tx in ordered_map(fetch, read_ids(ids), threads=threads):
         util.dump_json(tx if not raw else tx['result'])
 
 @click.command()
 @click.argument('ids', nargs=-1)
 @click.option('--raw', '-r', is_flag=True)
-def get_result(ids: List[str], raw: bool = False):
-    '''Get the transaction result'''
+@threads_option
+def get_result(ids: List[str], raw: bool = False, threads: int = DEFAULT_THREADS):
+    '''Get the transaction result
+
+    Use "-" to read IDs from stdin.
+    '''
     svc = service.get_instance()
-    for id in ids:
-        result = svc.get_transaction_result(id, full_response=raw)
+    fetch = lambda id: svc.get_transaction_result(id, full_response=raw)
+    for result in ordered_map(fetch, read_ids(ids), threads=threads):
         log.tx_result('Result', result if not raw else result['result'], raw=raw)
 
-@click.command(help="Get data of the hash")
+@click.command(help="Get data of the hash (use \"-\" to read hashes from stdin)")
 @click.argument('hash', nargs=-1)
 @click.option('--binary', '-b', is_flag=True)
 @click.option('--out', '-o', type=click.File('wb'), default='-')
-def get_data(hash: List[str], binary: bool, out: io.RawIOBase):
+@threads_option
+def get_data(hash: List[str], binary: bool, out: io.RawIOBase, threads: int = DEFAULT_THREADS):
     svc = service.get_instance()
-    for id in hash:
-        data = svc.get_data_by_hash(util.ensure_hash(id))
+    fetch = lambda id: svc.get_data_by_hash(util.ensure_hash(id))
+    for data in ordered_map(fetch, read_ids(hash), threads=threads):
         if binary:
             out.write(base64.decodebytes(data.encode()))
         else:
             util.dump_json(data, fp=io.TextIOWrapper(out))
 
-@click.command(help="Get SCORE status")
-@click.argument("scores", type=util.SCORE, nargs=-1)
+@click.command(help="Get SCORE status (use \"-\" to read addresses from stdin)")
+@click.argument("scores", nargs=-1)
 @click.option('--raw', '-r', is_flag=True)
 @click.option('--height', type=util.INT)
-def get_score(scores: List[str], height: int = None, raw: bool = False):
+@threads_option
+def get_score(scores: List[str], height: int = None, raw: bool = False, threads: int = DEFAULT_THREADS):
     svc = service.get_instance()
-    for score in scores:
-        result = svc.get_score_status(score, height=height, full_response=raw)
+    # validate all addresses before fetching any of them
+    try:
+        scores = [ util.ensure_score(score) for score in read_ids(scores) ]
+    except Exception as exc:
+        raise click.BadParameter(str(exc), param_hint='SCORES')
+    fetch = lambda score: svc.get_score_status(score, height=height, full_response=raw)
+    for result in ordered_map(fetch, scores, threads=threads):
         util.dump_json(result if not raw else result['result'])
 
 @click.command(help="Get SCORE History")
@@ -98,7 +137,8 @@ def get_codes(score: str):
     while True:
         try:
             status = svc.get_score_status(score, height=height)
-        except:
+        except JSONRPCException:
+            # no SCORE before the first deployment
             break
         if 'current' not in status:
             break
@@ -119,25 +159,15 @@ def get_codes(score: str):
     for height, status in history:
         p.print_data(height, status)
 
-def get_account(addr: str, svc: service.Service = None) -> List[Row]:
-    if svc is None:
-        svc = service.get_instance()
-
+def account_rows(addr: str, balance: int, status: Optional[dict], audit_tx: Optional[dict]) -> List[Row]:
     rows = [
         Header('Basic', 5),
         Row(addr, 42, '{}', 'Address'),
-    ]
-
-    balance = svc.get_balance(addr)
-    rows += [
         Row(lambda v: util.format_decimals(balance, 3), 32, '{:>28s} ICX', 'Balance'),
     ]
 
-    if addr.startswith('cx'):
-        status = svc.get_score_status(addr)
-        audit_txhash = status.get('current', {}).get('auditTxHash', None)
-        if audit_txhash is not None:
-            audit_tx = svc.get_transaction(audit_txhash)
+    if status is not None:
+        if audit_tx is not None:
             status['current']['height'] = str(audit_tx['blockHeight'])
         rows += [
             Header('SCORE', 20),
@@ -154,12 +184,42 @@ def get_account(addr: str, svc: service.Service = None) -> List[Row]:
             ]
     return rows
 
+def get_accounts(addrs: List[str], svc: service.Service = None) -> List[List[Row]]:
+    '''
+    Returns rows of the accounts. Balances and SCORE status of all the
+    accounts are queried in a batch, then audit transactions in another.
+    '''
+    if svc is None:
+        svc = service.get_instance()
+
+    with svc.batch() as batch:
+        balances = [ batch.get_balance(addr) for addr in addrs ]
+        statuses = [ batch.get_score_status(addr) if addr.startswith('cx') else None for addr in addrs ]
+    statuses = [ None if status is None else status.result() for status in statuses ]
+
+    audit_txs = {}
+    with svc.batch() as batch:
+        for status in statuses:
+            audit_txhash = (status or {}).get('current', {}).get('auditTxHash', None)
+            if audit_txhash is not None and audit_txhash not in audit_txs:
+                audit_txs[audit_txhash] = batch.get_transaction(audit_txhash)
+
+    accounts = []
+    for addr, balance, status in zip(addrs, balances, statuses):
+        audit_txhash = (status or {}).get('current', {}).get('auditTxHash', None)
+        audit_tx = audit_txs[audit_txhash].result() if audit_txhash is not None else None
+        accounts.append(account_rows(addr, balance.result(), status, audit_tx))
+    return accounts
+
+def get_account(addr: str, svc: service.Service = None) -> List[Row]:
+    return get_accounts([addr], svc)[0]
+
 @click.command('account', help='Show account information')
-@click.argument('addr', metavar='<address>', type=wallet.ADDRESS)
-def show_account(addr: str):
-    rows = get_account(addr)
-    rows.append(Header('END', 3))
-    MapPrinter(rows).print_data(None)
+@click.argument('addrs', metavar='<address>...', type=wallet.ADDRESS, nargs=-1, required=True)
+def show_account(addrs: List[str]):
+    for rows in get_accounts(list(addrs)):
+        rows.append(Header('END', 3))
+        MapPrinter(rows).print_data(None)
 
 @click.command('deploy', help='Deploy contract')
 @click.option('--to', metavar='<to>', type=wallet.ADDRESS)
@@ -281,8 +341,6 @@ def transfer(to: str, amount: str):
     result = do_transfer(ks, to, amount)
     log.tx_result('Transfer', result)
 
-ScaleSearchHeight = 1000_000
-
 @click.command('block-near', help='Get block near timestamp')
 @click.argument('target_ts', metavar='<timestamp>', type=str)
 def block_near(target_ts: str):
@@ -297,40 +355,16 @@ def block_near(target_ts: str):
     print(f'DateTime={util.format_dt(dt)} TimeStamp={target_ts}', file=sys.stderr)
 
     svc = service.get_instance()
+    index = blocktime.TimestampIndex(svc)
 
-    lblk = svc.get_block(2)
-    rblk = svc.get_block('latest')
     cnt = 0
-    if target_ts < lblk['time_stamp'] or target_ts > rblk['time_stamp']:
-        raise click.BadParameter(f'No block found at timestamp {target_ts}')
-    while True:
-        lblk_height = lblk['height']
-        rblk_height = rblk['height']
-        if rblk_height < lblk_height+ScaleSearchHeight:
-            lblk_ts = lblk['time_stamp']
-            rblk_ts = rblk['time_stamp']
-            height = (target_ts - lblk_ts) * (rblk_height - lblk_height) // (rblk_ts - lblk_ts) + lblk_height
-        else:
-            height = (rblk_height + lblk_height)//2
-
-        if height == lblk_height:
-            util.dump_json(lblk)
-            return
-        elif height == rblk_height:
-            util.dump_json(rblk)
-            return
-
-        blk = svc.get_block(height)
+    def on_probe(height: int, ts: int):
+        nonlocal cnt
         cnt += 1
-        print(f'[{cnt}] BH-{blk["height"]} TS={blk["time_stamp"]} {lblk_height} {rblk_height}', file=sys.stderr)
-        blk_ts = blk['time_stamp']
-        if target_ts < blk_ts:
-            rblk = blk
-        elif target_ts > blk_ts:
-            lblk = blk
-        else:
-            util.dump_json(blk)
-            return
-        if rblk['height'] == lblk['height']:
-            util.dump_json(blk)
-            return
+        print(f'[{cnt}] BH-{height} TS={ts}', file=sys.stderr)
+
+    try:
+        height = index.find(target_ts, on_probe)
+    except ValueError:
+        raise click.BadParameter(f'No block found at timestamp {target_ts}')
+    util.dump_json(svc.get_block(height))
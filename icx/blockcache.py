@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+CACHE_FILE = 'cache.db'
+DEFAULT_MAX_SIZE = 512*1024*1024
+
+# evicted down to this ratio of the max size, so it doesn't evict on every put
+EVICT_RATIO = 0.9
+
+# access time is updated on a hit only if it's older than this (in seconds).
+# updates are written with the next put or flush, so reads don't commit.
+ATIME_RESOLUTION = 60.0
+
+class BlockCache:
+    '''
+    Persistent cache for immutable chain data (finalized blocks, headers,
+    votes and data by hash). Entries are keyed by (nid, kind, key) and the
+    least recently used ones are evicted when the total size exceeds max_size.
+
+    It also keeps a sparse height to timestamp index, which is small and
+    never evicted.
+    '''
+    def __init__(self, file: str, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.__file = file
+        self.__max_size = max_size
+        self.__conn: Optional[sqlite3.Connection] = None
+        self.__size = 0
+        self.__lock = threading.Lock()
+        self.__touched: Dict[Tuple[int, str, str], float] = {}
+
+    @property
+    def file(self) -> str:
+        return self.__file
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__conn is None:
+            base_dir = os.path.dirname(self.__file)
+            if base_dir:
+                os.makedirs(base_dir, exist_ok=True, mode=0o700)
+            conn = sqlite3.connect(self.__file, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS items (
+                nid INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                atime REAL NOT NULL,
+                PRIMARY KEY (nid, kind, key))''')
+            conn.execute('CREATE INDEX IF NOT EXISTS items_atime ON items (atime)')
+            conn.execute('''CREATE TABLE IF NOT EXISTS timestamps (
+                nid INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                PRIMARY KEY (nid, height))''')
+            conn.commit()
+            self.__size = conn.execute('SELECT COALESCE(SUM(size),0) FROM items').fetchone()[0]
+            self.__conn = conn
+        return self.__conn
+
+    def get(self, nid: int, kind: str, key: Any, default: Any = None) -> Optional[Any]:
+        '''
+        Returns the cached value, or default if it's not cached
+        (give a sentinel to distinguish a cached None).
+        '''
+        with self.__lock:
+            try:
+                conn = self.__connect()
+                row = conn.execute('SELECT value, atime FROM items WHERE nid=? AND kind=? AND key=?',
+                                   (nid, kind, str(key))).fetchone()
+            except sqlite3.Error:
+                return default
+            if row is None:
+                return default
+            now = time.time()
+            if row[1] < now - ATIME_RESOLUTION:
+                self.__touched[(nid, kind, str(key))] = now
+        return json.loads(row[0])
+
+    def __write_touched(self, conn: sqlite3.Connection):
+        if len(self.__touched) > 0:
+            conn.executemany('UPDATE items SET atime=? WHERE nid=? AND kind=? AND key=?',
+                             [ (atime, nid, kind, key) for (nid, kind, key), atime in self.__touched.items() ])
+            self.__touched.clear()
+
+    def flush(self):
+        '''
+        Write access times of the entries read since the last put.
+        '''
+        with self.__lock:
+            if self.__conn is None or len(self.__touched) == 0:
+                return
+            try:
+                self.__write_touched(self.__conn)
+                self.__conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def put(self, nid: int, kind: str, key: Any, value: Any):
+        data = json.dumps(value, separators=(',', ':'))
+        with self.__lock:
+            try:
+                conn = self.__connect()
+                old = conn.execute('SELECT size FROM items WHERE nid=? AND kind=? AND key=?',
+                                   (nid, kind, str(key))).fetchone()
+                conn.execute('INSERT OR REPLACE INTO items VALUES (?,?,?,?,?,?)',
+                             (nid, kind, str(key), data, len(data), time.time()))
+                self.__size += len(data) - (old[0] if old is not None else 0)
+                self.__write_touched(conn)
+                if self.__size > self.__max_size:
+                    self.__evict(conn, int(self.__max_size*EVICT_RATIO))
+                conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def __evict(self, conn: sqlite3.Connection, target: int):
+        while self.__size > target:
+            rows = conn.execute('SELECT rowid, size FROM items ORDER BY atime LIMIT 256').fetchall()
+            if len(rows) == 0:
+                self.__size = 0
+                break
+            conn.executemany('DELETE FROM items WHERE rowid=?', [(row[0],) for row in rows])
+            self.__size -= sum(row[1] for row in rows)
+
+    def get_timestamps(self, nid: int) -> List[Tuple[int, int]]:
+        with self.__lock:
+            try:
+                conn = self.__connect()
+                return conn.execute('SELECT height, ts FROM timestamps WHERE nid=? ORDER BY height',
+                                    (nid,)).fetchall()
+            except sqlite3.Error:
+                return []
+
+    def put_timestamp(self, nid: int, height: int, ts: int):
+        with self.__lock:
+            try:
+                conn = self.__connect()
+                conn.execute('INSERT OR REPLACE INTO timestamps VALUES (?,?,?)', (nid, height, ts))
+                conn.commit()
+            except sqlite3.Error:
+                pass
@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 
 import base64
+import functools
 from hashlib import sha3_256
-from typing import Optional, List
-from . import rlp, service
+import itertools
+import sys
+from typing import Dict, Iterator, Optional, List, Tuple
+from . import blocktime, blockvotes, rlp, service, util
+from .prefetch import DEFAULT_THREADS, ordered_map
+import click
 import coincurve
 
 class Binary(bytes):
+    __slots__ = ()
+
     def __new__(self, *args, **kwargs) -> 'Binary':
         return bytes.__new__(Binary, *args, **kwargs)
 
@@ -44,6 +51,11 @@ class Binary(bytes):
     def to_integer(bs: bytes) -> int:
         return int.from_bytes(bs, byteorder='big', signed=True)
 
+    @staticmethod
+    def from_integer(v: int) -> 'Binary':
+        size = ((v if v >= 0 else ~v).bit_length()+8)//8
+        return Binary(v.to_bytes(size, byteorder='big', signed=True))
+
     @staticmethod
     def to_address(bs: bytes) -> str:
         if len(bs) != 21:
@@ -60,9 +72,23 @@ class Binary(bytes):
 
 
 def rlpitem(offset: int, convert = lambda x: x):
+    '''
+    Accessor for the item at the offset. Converted value is memoized
+    in the attribute "_<name>" (a slot for RLPRecord), so following
+    calls return the same object.
+    '''
     def decorator(func):
+        name = func.__name__
+        attr = f'_{name}'
         def callee_func(self):
-            return convert(self[offset])
+            try:
+                return getattr(self, attr)
+            except AttributeError:
+                value = convert(self[offset])
+                setattr(self, attr, value)
+                return value
+        callee_func.__name__ = name
+        callee_func.__doc__ = func.__doc__
         return callee_func
     return decorator
 
@@ -84,16 +110,49 @@ class RLPList(tuple):
         binary = Binary.from_any(data)
         return clz(binary.rlp_decode())
 
+class RLPRecord:
+    '''
+    Slotted counterpart of RLPList for the records kept in large numbers.
+    Subclasses declare a slot for each memoized accessor ("_<name>"),
+    so there is no instance dict.
+    '''
+    __slots__ = ('_items',)
+
+    def __init__(self, data: any):
+        if not isinstance(data, list) and not isinstance(data, tuple):
+            raise Exception('NotAList')
+        self._items = tuple(data)
+
+    def __getitem__(self, idx):
+        return self._items[idx]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def as_bytes(self) -> bytes:
+        return rlp.encode(self._items)
+
+    def as_binary(self) -> Binary:
+        return Binary(rlp.encode(self._items))
+
+    @classmethod
+    def from_binary(clz, data: any) -> 'RLPRecord':
+        binary = Binary.from_any(data)
+        return clz(binary.rlp_decode())
+
 class BAddress(str):
+    __slots__ = ()
+
     def __new__(cls, v, s: str = None):
-        binary = Binary.from_any(v)
-        s = Binary.as_address(binary) if s is None else s
-        self = super().__new__(cls, s)
-        self.__binary = binary
-        return self
+        if s is None:
+            s = Binary.to_address(Binary.from_any(v))
+        return super().__new__(cls, s)
 
     def as_binary(self) -> Binary:
-        return self.__binary
+        return Binary(bytes([1 if self.startswith('cx') else 0])+bytes.fromhex(self[2:]))
 
     @staticmethod
     def from_publickey(pk: coincurve.PublicKey) -> 'BAddress':
@@ -112,35 +171,61 @@ class BAddress(str):
 
 
 class BString(str):
+    __slots__ = ()
+
     def __new__(cls, v: any):
-        binary = Binary.from_any(v)
-        self = super().__new__(cls, Binary.to_string(binary))
-        self.__binary = binary
-        return self
+        return super().__new__(cls, Binary.to_string(Binary.from_any(v)))
 
     def as_binary(self) -> Binary:
-        return self.__binary
+        return Binary(self.encode())
 
     def as_json(self) -> any:
         return str(self)
 
 
 class BInteger(int):
+    __slots__ = ()
+
     def __new__(cls, v: any):
         binary = Binary.from_any(v)
-        self = super().__new__(cls, Binary.to_integer(binary))
-        self.__binary = binary
-        return self
-    
+        value = Binary.to_integer(binary)
+        if binary == Binary.from_integer(value):
+            return super().__new__(cls, value)
+        # keep the size only if the binary is not the shortest form
+        return int.__new__(raw_integer_type(len(binary)), value)
+
     def as_binary(self) -> Binary:
-        return self.__binary
+        return Binary.from_integer(self)
 
     def as_json(self) -> any:
         return f'{self:#x}'
 
-class Block(RLPList):
+class RawBInteger(BInteger):
+    '''
+    BInteger of the binary which is not the shortest form (ex. b'' for zero).
+    The binary is the value in SIZE bytes, so there is a type for each size
+    (see raw_integer_type) instead of keeping the binary.
+    '''
+    __slots__ = ()
+    SIZE = 0
+
+    def as_binary(self) -> Binary:
+        return Binary(int(self).to_bytes(self.SIZE, byteorder='big', signed=True))
+
+@functools.cache
+def raw_integer_type(size: int) -> type:
+    return type(f'RawBInteger{size}', (RawBInteger,), { '__slots__': (), 'SIZE': size })
+
+class Block(RLPRecord):
+    __slots__ = ('_hash', '_version', '_height', '_proposer', '_previous_id',
+                 '_votes_hash', '_next_validators_hash')
+
     def hash(self) -> Binary:
-        return self.as_binary().sha3_256()
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = self.as_binary().sha3_256()
+            return self._hash
 
     @rlpitem(0, BInteger)
     def version(self) -> BInteger:
@@ -164,7 +249,7 @@ class Block(RLPList):
 
     def votes(self, svc: service.Service) -> 'BlockVotes':
         data = svc.get_data_by_hash(str(self.votes_hash()))
-        return BlockVotes(data)
+        return BlockVotes.from_binary(data)
 
     @rlpitem(6, Binary)
     def next_validators_hash(self) -> Binary:
@@ -192,17 +277,22 @@ class BlockVotes(RLPList):
     def check_voted(self, blk: Block) -> List[str]:
         voted = []
         blk_hash = blk.hash()
+        height = blk.height().as_binary()
+        vote_round = self.round().as_binary()
+        partset_id = self.partset_id()
+        vote_msg = bytearray()
         for v in self[2]:
             sig = v[1]
-            vote_msg = rlp.encode([
-                blk.height().as_binary(),
-                self.round().as_binary(),
+            vote_msg.clear()
+            rlp.encode_into(vote_msg, [
+                height,
+                vote_round,
                 b'\x01',
                 blk_hash,
-                self.partset_id(),
+                partset_id,
                 v[0],
             ])
-            vote_hash = Binary(vote_msg).sha3_256()
+            vote_hash = sha3_256(vote_msg).digest()
             pk = coincurve.PublicKey.from_signature_and_message(sig, vote_hash, hasher=None)
             addr = BAddress.from_publickey(pk)
             voted.append(addr)
@@ -230,6 +320,67 @@ def to_binary(v: any) -> any:
     if v is None:
         return None
 
+def iterate_votes(svc: service.Service, start: int, end: int, *,
+                  threads: int = DEFAULT_THREADS) -> Iterator[Tuple[Block, List[str], List[str]]]:
+    '''
+    Returns iterator of (block, validators, voted) for blocks in the range
+    (inclusive). Votes of a block are in the header of the next block, so
+    each header is fetched once. Validators are fetched once for each hash.
+    '''
+    def fetch(height: int) -> Tuple[Optional[Block], BlockVotes]:
+        try:
+            nblk = Block.from_binary(svc.get_block_header_by_height(height+1))
+            return nblk, nblk.votes(svc)
+        except blocktime.HEADER_ERRORS:
+            # no next header yet (ex. the last block)
+            return None, BlockVotes.from_binary(svc.get_votes_by_height(height))
+
+    def iterate_blocks() -> Iterator[Tuple[Block, BlockVotes]]:
+        blk = Block.from_binary(svc.get_block_header_by_height(start))
+        blocks = ordered_map(fetch, range(start, end+1), threads=threads, window=threads*4)
+        for height, (nblk, votes) in zip(itertools.count(start), blocks):
+            if blk is None:
+                blk = Block.from_binary(svc.get_block_header_by_height(height))
+            yield blk, votes
+            blk = nblk
+
+    def check(item: Tuple[Block, BlockVotes]) -> Tuple[Block, List[str]]:
+        blk, votes = item
+        return blk, votes.check_voted(blk)
+
+    validators: Dict[bytes, List[str]] = {}
+    prev = Block.from_binary(svc.get_block_header_by_height(start-1))
+    for blk, voted in ordered_map(check, iterate_blocks(), threads=threads):
+        vhash = prev.next_validators_hash()
+        if vhash not in validators:
+            validators[vhash] = [ Binary.to_address(v) for v in prev.next_validators(svc) ]
+        yield blk, validators[vhash], voted
+        prev = blk
+
+@click.command('participation')
+@click.argument('start', type=util.INT)
+@click.argument('end', type=util.INT)
+@click.option('--threads', type=click.INT, default=DEFAULT_THREADS, help='Number of blocks to fetch concurrently')
+def show_participation(start: int, end: int, threads: int = DEFAULT_THREADS):
+    '''
+    Show voting participation of validators for the blocks from START to END
+
+    Blocks with unvoted validators are shown while it walks the range,
+    then the participation is shown as "votes --range" does.
+    '''
+    svc = service.get_instance()
+    report = blockvotes.Participation()
+    for blk, validators, voted in iterate_votes(svc, start, end, threads=threads):
+        voted = set(voted)
+        unvoted = [ addr for addr in validators if addr not in voted ]
+        if len(unvoted) > 0:
+            print(f'[{blk.height():10,}] unvoted={",".join(unvoted)}')
+        else:
+            click.secho(f'\033[K> Checked height={blk.height()}\r', nl=False, fg='bright_black', file=sys.stderr)
+        report.add(validators, voted, blk.proposer())
+    click.secho('\033[K', nl=False, file=sys.stderr)
+    report.print()
+
 if __name__ == '__main__':
     svc = service.get_instance()
     blk = svc.get_block('latest')
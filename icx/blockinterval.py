@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 
-from concurrent import futures
 import base64
-from typing import List
+from collections import deque
+import sys
 import click
+import numpy as np
+import pandas as pd
 
-from . import service, util
+from . import blocktime, service, util
+from .blockvotes import BLOCK
+from .prefetch import ordered_map
 
 def get_data(svc: service.Service, hash: str) -> bytes:
     draw_base64 = svc.get_data_by_hash(util.ensure_block(hash))
@@ -15,13 +19,13 @@ def get_data(svc: service.Service, hash: str) -> bytes:
 class MovingAverage:
     def __init__(self, count:int):
         self.count = count
-        self.items = []
+        self.items = deque()
         self.sum = 0
     def add(self, value:int) -> int:
         self.sum += value
         self.items.append(value)
         if len(self.items) > self.count:
-            old = self.items.pop(0)
+            old = self.items.popleft()
             self.sum -= old
         return self.get()
     def get(self) -> int:
@@ -30,37 +34,135 @@ class MovingAverage:
 
 INTERVAL_WINDOW = 30
 INTERVAL_THREADS = 6
+INTERVAL_BINS = 10
+PERCENTILES = [ 50, 90, 99, 99.9 ]
+
+# intervals over Q3 + OUTLIER_IQR * IQR are reported as outliers
+OUTLIER_IQR = 3
+
+def get_proposer(blk: dict) -> str:
+    return blk.get('peer_id', '')
+
+def get_block_summary(svc: service.Service, height: int) -> dict:
+    '''
+    Returns height, time_stamp and peer_id of the block. They are read from
+    the block header, then it falls back to the full block if the header
+    is not available (ex. blocks before migration to goloop).
+    '''
+    try:
+        hdr = blocktime.get_header(svc, height)
+    except blocktime.HEADER_ERRORS:
+        return svc.get_block(height)
+    return {
+        'height': height,
+        'time_stamp': int.from_bytes(hdr[BLOCK.TIMESTAMP], byteorder='big', signed=True),
+        'peer_id': f'hx{hdr[BLOCK.PROPOSER][1:].hex()}',
+    }
+
+def collect_intervals(svc: service.Service, start: int, count: int, threads: int, get_block) -> pd.DataFrame:
+    '''
+    Returns DataFrame of height, timestamp (us), proposer and interval (us)
+    of "count" blocks from "start" height.
+    '''
+    heights = np.arange(start-1, start+count, dtype=np.int64)
+    timestamps = np.zeros(len(heights), dtype=np.int64)
+    proposers = [''] * len(heights)
+    blocks = ordered_map(get_block, heights.tolist(), threads=threads)
+    for idx, blk in enumerate(blocks):
+        timestamps[idx] = blk['time_stamp']
+        proposers[idx] = get_proposer(blk)
+        if idx % 1000 == 0:
+            click.secho(f'\033[K> Fetched height={blk["height"]}\r', nl=False, fg='bright_black', file=sys.stderr)
+    click.secho('\033[K', nl=False, file=sys.stderr)
+    return pd.DataFrame({
+        'height': heights[1:],
+        'timestamp': timestamps[1:],
+        'proposer': proposers[1:],
+        'interval': np.diff(timestamps),
+    })
+
+def show_analytics(df: pd.DataFrame, guide_ms: int, bins: int, window: int):
+    intervals = df['interval'].to_numpy() / 1000
+    print(f'Blocks      : {len(intervals):,} ({df["height"].iloc[0]} ~ {df["height"].iloc[-1]})')
+    print(f'Mean        : {intervals.mean():10.3f}ms ({intervals.mean()-guide_ms:9.3f}ms)')
+    print(f'StdDev      : {intervals.std():10.3f}ms')
+    print(f'Min / Max   : {intervals.min():10.3f}ms / {intervals.max():.3f}ms')
+    for p, v in zip(PERCENTILES, np.percentile(intervals, PERCENTILES)):
+        print(f'P{p:<10} : {v:10.3f}ms')
+
+    rolling = pd.Series(intervals).rolling(window).mean().dropna()
+    if len(rolling) > 0:
+        print(f'Rolling({window}) : {rolling.min():10.3f}ms ~ {rolling.max():.3f}ms')
+
+    print('Histogram')
+    counts, edges = np.histogram(intervals, bins=bins)
+    width = 50
+    scale = width / max(counts.max(), 1)
+    for c, lo, hi in zip(counts, edges[:-1], edges[1:]):
+        print(f'  {lo:10.3f} ~ {hi:10.3f}ms {c:8,} {"#"*int(c*scale)}')
+
+    q1, q3 = np.percentile(intervals, [25, 75])
+    limit = q3 + OUTLIER_IQR * (q3 - q1)
+    outliers = df[intervals > limit]
+    print(f'Outliers (> {limit:.3f}ms) : {len(outliers):,}')
+    for row in outliers.itertuples(index=False):
+        print(f'  [{row.height:10,}] interval={row.interval/1000:10.3f}ms proposer={row.proposer}')
+    if len(outliers) > 0:
+        print('Outliers by proposer')
+        for proposer, cnt in outliers['proposer'].value_counts().items():
+            print(f'  {proposer} {cnt:8,}')
+
+def export_intervals(df: pd.DataFrame, file: str):
+    if file.endswith('.parquet'):
+        try:
+            df.to_parquet(file, index=False)
+        except ImportError as exc:
+            raise click.ClickException(f'Parquet is not available ({exc})')
+    else:
+        df.to_csv(file, index=False)
 
 @click.command()
 @click.argument('start', type=click.INT)
 @click.argument('count', type=click.INT, required=False)
 @click.option('--guide', help="Block interval configuration in milli-second", type=click.INT, default=1000)
 @click.option('--threads', '-t', type=click.INT, default=INTERVAL_THREADS)
-def block_interval(start: int, guide: int, threads: int, count: int = None):
+@click.option('--stats', '-s', is_flag=True, help='Show statistics of intervals instead of each block')
+@click.option('--bins', type=click.INT, default=INTERVAL_BINS, help='Number of bins of the histogram')
+@click.option('--window', type=click.INT, default=INTERVAL_WINDOW, help='Window size of moving average')
+@click.option('--export', '-o', 'export', metavar='<file>', help='Export intervals to the file (CSV or .parquet)')
+@click.option('--full', is_flag=True, help='Fetch full blocks instead of block headers')
+def block_interval(start: int, guide: int, threads: int, count: int = None,
+                   stats: bool = False, bins: int = INTERVAL_BINS, window: int = INTERVAL_WINDOW,
+                   export: str = None, full: bool = False):
     '''
     Check intervals of "count" blocks from "start" height
     '''
     svc = service.get_instance()
 
     guide_ms = guide*1000
-    moving_average = MovingAverage(INTERVAL_WINDOW)
-    executor = futures.ThreadPoolExecutor()
-    items: List[futures.Future] = []
 
     if count is None:
         blk = svc.get_block('latest')
         count = start
         start = blk['height'] - count
 
-    blk = svc.get_block(start-1)
+    if full:
+        get_block = svc.get_block
+    else:
+        get_block = lambda height: get_block_summary(svc, height)
+
+    if stats or export is not None:
+        df = collect_intervals(svc, start, count, threads, get_block)
+        if export is not None:
+            export_intervals(df, export)
+        if stats:
+            show_analytics(df, guide, bins, window)
+        return
+
+    moving_average = MovingAverage(window)
+    blk = get_block(start-1)
     ts = blk['time_stamp']
-    height = start
-    while len(items) > 0 or height < start+count:
-        while len(items) < threads and height < start+count:
-            ret, height = executor.submit(svc.get_block, height), height+1
-            items.append(ret)
-        item = items.pop(0)
-        blk = item.result()
+    for blk in ordered_map(get_block, range(start, start+count), threads=threads):
         ts2 = blk['time_stamp']
         interval, ts = ts2-ts, ts2
         interval_avg = moving_average.add(interval)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import base64
+import bisect
+from typing import Callable, Dict, Optional, Tuple
+
+import requests
+from iconsdk.exception import HTTPError, JSONRPCException
+
+from . import rlp, service
+from .blockvotes import BLOCK
+
+INDEX_STEP = 10_000
+FIRST_HEIGHT = 2
+
+# failures of header requests to fall back to the full block
+# (ex. blocks before migration to goloop don't have headers)
+HEADER_ERRORS = (JSONRPCException, HTTPError, requests.RequestException)
+
+def get_header(svc: service.Service, height: int) -> list:
+    return rlp.decode_bytes(base64.b64decode(svc.get_block_header_by_height(height)))
+
+def get_timestamp(svc: service.Service, height: int) -> int:
+    try:
+        hdr = get_header(svc, height)
+    except HEADER_ERRORS:
+        return svc.get_block(height)['time_stamp']
+    return int.from_bytes(hdr[BLOCK.TIMESTAMP], byteorder='big', signed=True)
+
+class TimestampIndex:
+    '''
+    Sparse index of block timestamps. Timestamps are read from block headers
+    (or blocks if headers are not available), and the ones for every
+    INDEX_STEP blocks are stored to the cache of the service, so following
+    searches start from a narrow range.
+    '''
+    def __init__(self, svc: service.Service, step: int = INDEX_STEP) -> None:
+        self.__service = svc
+        self.__step = step
+        self.__timestamps: Dict[int, int] = {}
+        if svc.cache is not None:
+            for height, ts in svc.cache.get_timestamps(svc.nid):
+                self.__timestamps[height] = ts
+        self.__heights = sorted(self.__timestamps.keys())
+
+    def __record(self, height: int, ts: int):
+        if height in self.__timestamps:
+            return
+        self.__timestamps[height] = ts
+        bisect.insort(self.__heights, height)
+        if self.__service.cache is not None:
+            self.__service.cache.put_timestamp(self.__service.nid, height, ts)
+
+    def timestamp_of(self, height: int) -> int:
+        if height in self.__timestamps:
+            return self.__timestamps[height]
+        ts = get_timestamp(self.__service, height)
+        if height % self.__step == 0 or height == FIRST_HEIGHT:
+            self.__record(height, ts)
+        return ts
+
+    def bracket_of(self, ts: int) -> Tuple[Optional[Tuple[int,int]], Optional[Tuple[int,int]]]:
+        '''
+        Returns indexed (height, timestamp) of the nearest blocks,
+        with timestamp <= ts and with timestamp > ts.
+        '''
+        lo, hi = None, None
+        for height in self.__heights:
+            hts = self.__timestamps[height]
+            if hts <= ts:
+                lo = (height, hts)
+            else:
+                hi = (height, hts)
+                break
+        return lo, hi
+
+    def find(self, ts: int, on_probe: Callable[[int, int], None] = None) -> int:
+        '''
+        Returns the height of the last block with timestamp <= ts.
+        '''
+        lo, hi = self.bracket_of(ts)
+        if lo is None:
+            lo = (FIRST_HEIGHT, self.timestamp_of(FIRST_HEIGHT))
+            if ts < lo[1]:
+                raise ValueError(f'NoBlockAt(ts={ts},first={lo[1]})')
+        if hi is None:
+            last = self.__service.get_block('latest')
+            if ts > last['time_stamp']:
+                raise ValueError(f'NoBlockAt(ts={ts},last={last["time_stamp"]})')
+            elif ts == last['time_stamp']:
+                return last['height']
+            hi = (last['height'], last['time_stamp'])
+
+        last_side, repeats = None, 0
+        while hi[0] - lo[0] > 1:
+            span = hi[0] - lo[0]
+            if repeats >= 2:
+                # interpolation isn't converging, bisect this time
+                height = (lo[0] + hi[0])//2
+            else:
+                height = lo[0] + (ts - lo[1]) * span // (hi[1] - lo[1])
+            if span > self.__step:
+                # probe heights to be indexed while the range is wide
+                height = (height + self.__step//2) // self.__step * self.__step
+                height = max(height, (lo[0]//self.__step + 1) * self.__step)
+                height = min(height, (hi[0]-1)//self.__step * self.__step)
+            height = min(max(height, lo[0]+1), hi[0]-1)
+
+            hts = self.timestamp_of(height)
+            if on_probe is not None:
+                on_probe(height, hts)
+            side = hts <= ts
+            repeats = repeats+1 if side == last_side else 1
+            last_side = side
+            if side:
+                lo = (height, hts)
+            else:
+                hi = (height, hts)
+        return lo[0]
+
+def find_height(svc: service.Service, ts: int) -> int:
+    '''
+    Returns the height of the last block with timestamp <= ts (in micro-second).
+    '''
+    return TimestampIndex(svc).find(ts)
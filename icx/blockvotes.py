@@ -1,11 +1,18 @@
 import base64
+from concurrent import futures
 from hashlib import sha3_256
+import itertools
 import sys
-from typing import Optional
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 import click
 import coincurve
+import requests
+from iconsdk.exception import HTTPError, JSONRPCException
 from . import service
 from . import rlp, util
+from .prefetch import DEFAULT_THREADS, ordered_map
+
+TC_CLEAR = '\033[K'
 
 
 class BLOCK:
@@ -59,15 +66,193 @@ def show_validators(height: int = None):
     for v in validators:
         print(v)
 
+def get_votes(svc: service.Service, height: int, nhdr: list = None) -> list:
+    '''
+    Returns votes of the block, which are in the header of the next block.
+    Give the next header (NHDR) if it's already fetched.
+    '''
+    try:
+        if nhdr is None:
+            nhdr_bs = base64.b64decode(svc.get_block_header_by_height(height+1))
+            nhdr = rlp.decode_bytes(nhdr_bs)
+        vhash: bytes = nhdr[BLOCK.VOTES_HASH]
+        votes_bs = base64.b64decode(svc.get_data_by_hash(f'0x{vhash.hex()}'))
+        return rlp.decode_bytes(votes_bs)
+    except BaseException as exc:
+        votes_b64 = svc.get_votes_by_height(height)
+        votes_bs = base64.b64decode(votes_b64)
+        return rlp.decode_bytes(votes_bs)
+
+def get_vote_items(hdr: list, hdr_hash: bytes, votes: list) -> List[Tuple[bytes,bytes]]:
+    '''
+    Returns (signature, vote hash) of the votes for the block.
+    '''
+    items = []
+    vote_msg = bytearray()
+    for voteitem in votes[VOTES.ITEMS]:
+        sig = voteitem[VOTEITEM.SIGNATURE]
+        vote_msg.clear()
+        rlp.encode_into(vote_msg, [
+            hdr[BLOCK.HEIGHT],
+            votes[VOTES.ROUND],
+            b'\x01',
+            hdr_hash,
+            votes[VOTES.PARTSET_ID],
+            voteitem[VOTEITEM.TIMESTAMP]
+        ])
+        items.append((sig, sha3_256(vote_msg).digest()))
+    return items
+
+def recover_voter(item: Tuple[bytes,bytes]) -> Tuple[str,str]:
+    '''
+    Returns (address, public key) of the signer of the vote item
+    '''
+    sig, vote_hash = item
+    pk = coincurve.PublicKey.from_signature_and_message(sig, vote_hash, hasher=None)
+    addr = f'hx{sha3_256(pk.format(compressed=False)[1:]).digest()[-20:].hex()}'
+    return addr, pk.format().hex()
+
+RECOVER_CHUNK = 64
+
+def recover_voters(items: List[Tuple[bytes,bytes]], executor: futures.Executor = None) -> List[Tuple[str,str]]:
+    '''
+    Recover signers of the vote items, with the executor if it's given.
+    (Use process pool executor for concurrency)
+    '''
+    if executor is None:
+        return list(map(recover_voter, items))
+    return list(executor.map(recover_voter, items, chunksize=RECOVER_CHUNK))
+
+def parse_range(value: str) -> Tuple[int,int]:
+    start, end = value.split(':')
+    return int(start.replace(',', '_'), 0), int(end.replace(',', '_'), 0)
+
+class Participation:
+    def __init__(self, matrix: bool = False) -> None:
+        self.blocks = 0
+        self.voted: Dict[str,int] = {}
+        self.unvoted: Dict[str,int] = {}
+        self.proposed: Dict[str,int] = {}
+        self.marks: Optional[Dict[str,List[str]]] = {} if matrix else None
+
+    def add(self, validators: List[str], voted: Set[str], proposer: str):
+        for addr in validators:
+            if addr in voted:
+                self.voted[addr] = self.voted.get(addr, 0)+1
+                self.unvoted.setdefault(addr, 0)
+            else:
+                self.unvoted[addr] = self.unvoted.get(addr, 0)+1
+                self.voted.setdefault(addr, 0)
+            if addr == proposer:
+                self.proposed[addr] = self.proposed.get(addr, 0)+1
+            if self.marks is not None:
+                marks = self.marks.setdefault(addr, [])
+                marks.extend(' '*(self.blocks-len(marks)))
+                if addr == proposer:
+                    marks.append('*' if addr in voted else '!')
+                else:
+                    marks.append('o' if addr in voted else '.')
+        self.blocks += 1
+
+    def print(self):
+        for addr in self.voted.keys():
+            voted = self.voted[addr]
+            unvoted = self.unvoted[addr]
+            rate = voted*100/(voted+unvoted)
+            line = f'{addr} voted={voted:<6d} unvoted={unvoted:<6d} proposed={self.proposed.get(addr, 0):<6d} {rate:6.2f}%'
+            if self.marks is not None:
+                marks = self.marks[addr]
+                marks.extend(' '*(self.blocks-len(marks)))
+                line += ' ' + ''.join(marks)
+            print(line)
+
+RANGE_CHUNK = 256
+
+def iterate_votes_range(svc: service.Service, start: int, end: int, *,
+                        procs: int = None, threads: int = DEFAULT_THREADS
+                        ) -> Iterator[Tuple[int, List[str], Set[str], str]]:
+    '''
+    Returns iterator of (height, validators, voters, proposer) of the blocks
+    in the range (inclusive). Validators are fetched once for each hash,
+    and signatures are recovered in chunks with the process pool.
+    '''
+    def get_header(height: int) -> bytes:
+        return base64.b64decode(svc.get_block_header_by_height(height))
+
+    def fetch(height: int) -> Tuple[Optional[bytes], list]:
+        '''
+        Returns the header of the next block and votes of the block in it,
+        so each header is fetched once. The next header is None if it's
+        not available (ex. the last block).
+        '''
+        try:
+            nhdr_bs = get_header(height+1)
+        except (JSONRPCException, HTTPError, requests.RequestException):
+            return None, get_votes(svc, height)
+        return nhdr_bs, get_votes(svc, height, rlp.decode_bytes(nhdr_bs))
+
+    phdr = rlp.decode_bytes(get_header(start-1))
+    hdr_bs = get_header(start)
+    validators_by_hash: Dict[bytes,List[str]] = {}
+    blocks = ordered_map(fetch, range(start, end+1), threads=threads, window=threads*4)
+    with futures.ProcessPoolExecutor(max_workers=procs) as executor:
+        height = start
+        while height <= end:
+            items = []
+            spans = []
+            for nhdr_bs, votes in itertools.islice(blocks, RANGE_CHUNK):
+                if hdr_bs is None:
+                    hdr_bs = get_header(height+len(spans))
+                hdr = rlp.decode_bytes(hdr_bs)
+                vitems = get_vote_items(hdr, sha3_256(hdr_bs).digest(), votes)
+                spans.append((hdr, phdr, len(items), len(vitems)))
+                items += vitems
+                phdr, hdr_bs = hdr, nhdr_bs
+            voters = recover_voters(items, executor)
+            for hdr, phdr_, offset, size in spans:
+                vhash = phdr_[BLOCK.NEXTVALIDATOR_HASH]
+                if vhash not in validators_by_hash:
+                    validators_by_hash[vhash], _ = get_next_validators(svc, header=phdr_)
+                voted = set(addr for addr, _ in voters[offset:offset+size])
+                proposer = f'hx{hdr[BLOCK.PROPOSER][1:].hex()}'
+                yield height, validators_by_hash[vhash], voted, proposer
+                height += 1
+            click.secho(f'{TC_CLEAR}> Checked height={height-1}\r', nl=False, fg='bright_black', file=sys.stderr)
+    click.secho(f'{TC_CLEAR}', nl=False, file=sys.stderr)
+
+def check_votes_range(svc: service.Service, start: int, end: int, *,
+                      procs: int = None, threads: int = DEFAULT_THREADS, matrix: bool = False):
+    report = Participation(matrix)
+    for _, validators, voted, proposer in iterate_votes_range(svc, start, end, procs=procs, threads=threads):
+        report.add(validators, voted, proposer)
+    report.print()
+
 @click.command('votes')
 @click.argument('height', type=util.INT, required=False)
 @click.option('--pubkey', is_flag=True)
-def check_votes(height: int, pubkey: bool):
+@click.option('--range', 'height_range', metavar='<start>:<end>', help='Check votes of the blocks in the range')
+@click.option('--matrix', is_flag=True, help='Show votes of each block in range mode (o:voted .:unvoted *:voted proposer !:unvoted proposer)')
+@click.option('--procs', type=click.INT, default=None, help='Number of processes to recover signatures')
+@click.option('--threads', type=click.INT, default=DEFAULT_THREADS, help='Number of blocks to fetch concurrently')
+def check_votes(height: int, pubkey: bool, height_range: str = None, matrix: bool = False,
+                procs: int = None, threads: int = DEFAULT_THREADS):
     '''
     Check votes of the block and show vote information
+
+    With "--range", it checks votes of the blocks in the range (inclusive),
+    and shows participation of each validator.
     '''
     svc = service.get_instance()
 
+    if height_range is not None:
+        try:
+            start, end = parse_range(height_range)
+        except ValueError:
+            raise click.BadParameter(f'invalid range {height_range}', param_hint='--range')
+        click.secho(f'Check votes for height={start}..{end}', fg='bright_black', file=sys.stderr)
+        check_votes_range(svc, start, end, procs=procs, threads=threads, matrix=matrix)
+        return
+
     if height is None:
         blk = svc.get_block('latest')
         height = blk['height']
@@ -78,38 +263,17 @@ def check_votes(height: int, pubkey: bool):
     hdr = rlp.decode_bytes(hdr_bs)
     hdr_hash = sha3_256(hdr_bs).digest()
 
-    try:
-        nhdr_bs = base64.b64decode(svc.get_block_header_by_height(height+1))
-        nhdr = rlp.decode_bytes(nhdr_bs)
-        vhash: bytes = nhdr[BLOCK.VOTES_HASH]
-        votes_bs = base64.b64decode(svc.get_data_by_hash(f'0x{vhash.hex()}'))
-        votes = rlp.decode_bytes(votes_bs)
-    except BaseException as exc:
-        votes_b64 = svc.get_votes_by_height(height)
-        votes_bs = base64.b64decode(votes_b64)
-        votes = rlp.decode_bytes(votes_bs)
+    votes = get_votes(svc, height)
 
     phdr_b64 = svc.get_block_header_by_height(height-1)
     phdr_bs = base64.b64decode(phdr_b64)
     phdr = rlp.decode_bytes(phdr_bs)
 
     voted = []
-    for voteitem in votes[VOTES.ITEMS]:
-        sig = voteitem[VOTEITEM.SIGNATURE]
-        vote_msg = rlp.encode([
-            hdr[BLOCK.HEIGHT],
-            votes[VOTES.ROUND],
-            b'\x01',
-            hdr_hash,
-            votes[VOTES.PARTSET_ID],
-            voteitem[VOTEITEM.TIMESTAMP]
-        ])
-        vote_hash = sha3_256(vote_msg).digest()
-        pk = coincurve.PublicKey.from_signature_and_message(sig, vote_hash, hasher=None)
-        addr = f'hx{sha3_256(pk.format(compressed=False)[1:]).digest()[-20:].hex()}'
+    for addr, pk in recover_voters(get_vote_items(hdr, hdr_hash, votes)):
         voted.append(addr)
         if pubkey:
-            print(f'{addr} {pk.format().hex()}')
+            print(f'{addr} {pk}')
 
     if pubkey:
         return
@@ -117,4 +281,4 @@ def check_votes(height: int, pubkey: bool):
     validators, _ = get_next_validators(svc, header=phdr)
     proposer = f'hx{hdr[BLOCK.PROPOSER][1:].hex()}'
     for addr in validators:
-        print(f'{addr} {"voted" if addr in voted else "unvoted"}{" proposer" if addr == proposer else ""}')
\ No newline at end of file
+        print(f'{addr} {"voted" if addr in voted else "unvoted"}{" proposer" if addr == proposer else ""}')
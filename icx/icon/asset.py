@@ -9,8 +9,9 @@ from datetime import datetime, timedelta
 from typing import Iterable, List, Optional, Tuple, Union
 
 import click
-from iconsdk.builder.call_builder import CallBuilder
+from iconsdk.builder.call_builder import Call, CallBuilder
 from iconsdk.builder.transaction_builder import CallTransactionBuilder
+from iconsdk.exception import JSONRPCException
 from iconsdk.wallet.wallet import Wallet
 
 from .. import basic, log, service, util
@@ -31,15 +32,19 @@ class AssetService:
             svc = service.get_instance(svc)
         self.service = svc
 
-    def query_iscore(self, address: str, height: int = None) -> dict:
-        return self.service.call(CallBuilder(
+    @staticmethod
+    def query_iscore_call(address: str, height: int = None) -> Call:
+        return CallBuilder(
             to=CHAIN_SCORE,
             method='queryIScore',
             params = {
                 "address": address
             },
             height=height,
-        ).build())
+        ).build()
+
+    def query_iscore(self, address: str, height: int = None) -> dict:
+        return self.service.call(self.query_iscore_call(address, height))
 
     def claim_iscore(self, wallet: Wallet) -> dict:
         tx = CallTransactionBuilder(
@@ -66,21 +71,25 @@ class AssetService:
         blk = self.service.get_block('latest')
         return blk['height']
 
-    def get_balance(self, address: str, height: Optional[int]) -> int:
+    def get_balance(self, address: str, height: Optional[int] = None) -> int:
         return self.service.get_balance(address, height)
 
     def get_score_api(self, address: str):
         return self.service.get_score_api(address)
 
-    def get_stake(self, address: str, height: Optional[int]) -> dict:
-        return self.service.call(CallBuilder(
+    @staticmethod
+    def get_stake_call(address: str, height: Optional[int] = None) -> Call:
+        return CallBuilder(
             to=CHAIN_SCORE,
             method= "getStake",
             params = {
                 "address": address,
             },
             height=height,
-        ).build())
+        ).build()
+
+    def get_stake(self, address: str, height: Optional[int] = None) -> dict:
+        return self.service.call(self.get_stake_call(address, height))
 
     def stake_all(self, wallet: Wallet, remain: int = ICX, stake: dict = None ):
         balance = self.get_balance(wallet.get_address())
@@ -118,15 +127,19 @@ class AssetService:
         return self.service.estimate_and_send_tx(tx, wallet)
 
 
-    def get_delegation(self, address: str, height: Optional[int]) -> dict:
-        return self.service.call(CallBuilder(
+    @staticmethod
+    def get_delegation_call(address: str, height: Optional[int] = None) -> Call:
+        return CallBuilder(
             to=CHAIN_SCORE,
             method= "getDelegation",
             params = {
                 "address": address,
             },
             height = height,
-        ).build())
+        ).build()
+
+    def get_delegation(self, address: str, height: Optional[int] = None) -> dict:
+        return self.service.call(self.get_delegation_call(address, height))
 
     def delegate_all(self, preps: List[str], wallet: Wallet, target: int = 0, delegation: dict = None):
         if delegation is None:
@@ -174,15 +187,19 @@ class AssetService:
         ).build()
         return self.service.estimate_and_send_tx(tx, wallet)
 
-    def get_bond(self, address: str, height: Optional[int]) -> dict:
-        return self.service.call(CallBuilder(
+    @staticmethod
+    def get_bond_call(address: str, height: Optional[int] = None) -> Call:
+        return CallBuilder(
             to=CHAIN_SCORE,
             method= "getBond",
             params = {
                 "address": address,
             },
             height = height,
-        ).build())
+        ).build()
+
+    def get_bond(self, address: str, height: Optional[int] = None) -> dict:
+        return self.service.call(self.get_bond_call(address, height))
 
     def bond_adjust(self, preps: List[str], wallet: Wallet, change: int, bonds: dict):
         if bonds is None:
@@ -314,12 +331,25 @@ def show_asset_of(ctx: dict, addr: str, height: Optional[int]):
 
 
     service = AssetService()
-    balance = service.get_balance(addr, height=height)
-    iscore = service.query_iscore(addr, height=height)
-    stake = service.get_stake(addr, height=height)
-    delegation = service.get_delegation(addr, height=height)
-    bond = service.get_bond(addr, height=height)
-    last_height = height or service.get_last_height()
+    with service.service.batch() as batch:
+        balance = batch.get_balance(addr, height=height)
+        iscore = batch.call(service.query_iscore_call(addr, height=height))
+        stake = batch.call(service.get_stake_call(addr, height=height))
+        delegation = batch.call(service.get_delegation_call(addr, height=height))
+        bond = batch.call(service.get_bond_call(addr, height=height))
+        net_info = batch.request('icx_getNetworkInfo') if height is None else None
+    balance = balance.result()
+    iscore = iscore.result()
+    stake = stake.result()
+    delegation = delegation.result()
+    bond = bond.result()
+    if height is not None:
+        last_height = height
+    else:
+        try:
+            last_height = int(net_info.result()['latest'], 0)
+        except (JSONRPCException, KeyError, ValueError):
+            last_height = service.get_last_height()
     #print(json.dumps(balance, indent=2))
     #print(json.dumps(stake, indent=2))
     #print(json.dumps(delegation, indent=2))
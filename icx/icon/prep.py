@@ -10,7 +10,7 @@ from typing import Any, Iterable, List, Optional, Union
 
 import click
 import coincurve
-from iconsdk.builder.call_builder import CallBuilder
+from iconsdk.builder.call_builder import Call, CallBuilder
 from iconsdk.builder.transaction_builder import CallTransactionBuilder
 
 from . import asset
@@ -104,44 +104,54 @@ def get_service_with_rpc(server: str=None) -> service.Service:
     else:
         return service.get_instance()
 
-def icon_getPRep(addr: str, server: str=None, start: int=None, end: int=None, height: int=None) -> any:
-    svc = get_service_with_rpc(server)
+def icon_getPRep_call(addr: str, start: int=None, end: int=None, height: int=None) -> Call:
     params = { 'address':addr }
     if start is not None:
         params['startRanking'] = f'0x{start:x}'
     if end is not None:
         params['endRanking'] = f'0x{end:x}'
-    call = CallBuilder(to=util.CHAIN_SCORE, method='getPRep', params=params, height=height).build()
-    return svc.call(call)
+    return CallBuilder(to=util.CHAIN_SCORE, method='getPRep', params=params, height=height).build()
 
-def icon_getBonderList(addr: str, server: str = None, *, height: int=None) -> dict:
+def icon_getPRep(addr: str, server: str=None, start: int=None, end: int=None, height: int=None) -> any:
     svc = get_service_with_rpc(server)
+    return svc.call(icon_getPRep_call(addr, start, end, height))
+
+def icon_getBonderList_call(addr: str, *, height: int=None) -> Call:
     params = { 'address':addr }
-    call = CallBuilder(to=util.CHAIN_SCORE, method='getBonderList', params=params, height=height).build()
-    return svc.call(call)
+    return CallBuilder(to=util.CHAIN_SCORE, method='getBonderList', params=params, height=height).build()
 
-def icon_getBond(addr: str, server: str = None, *, height: int=None) -> dict:
+def icon_getBonderList(addr: str, server: str = None, *, height: int=None) -> dict:
     svc = get_service_with_rpc(server)
+    return svc.call(icon_getBonderList_call(addr, height=height))
+
+def icon_getBond_call(addr: str, *, height: int=None) -> Call:
     params = { 'address':addr }
-    call = CallBuilder(to=util.CHAIN_SCORE, method='getBond', params=params, height=height).build()
-    return svc.call(call)
+    return CallBuilder(to=util.CHAIN_SCORE, method='getBond', params=params, height=height).build()
 
-def icon_getPReps(server: str = None, start: int = None, height: int = None) -> any:
+def icon_getBond(addr: str, server: str = None, *, height: int=None) -> dict:
     svc = get_service_with_rpc(server)
+    return svc.call(icon_getBond_call(addr, height=height))
+
+def icon_getPReps_call(start: int = None, height: int = None) -> Call:
     params = None
     if start is not None:
         params = { "startRanking" : start }
-    call = CallBuilder(to=util.CHAIN_SCORE, method='getPReps', params=params, height=height).build()
-    return svc.call(call)
+    return CallBuilder(to=util.CHAIN_SCORE, method='getPReps', params=params, height=height).build()
+
+def icon_getPReps(server: str = None, start: int = None, height: int = None) -> any:
+    svc = get_service_with_rpc(server)
+    return svc.call(icon_getPReps_call(start, height))
+
+def icon_getNetworkInfo_call(height: int = None) -> Call:
+    return CallBuilder(to=util.CHAIN_SCORE, method='getNetworkInfo', params={}, height=height).build()
 
 def icon_getNetworkInfo(server: str = None, height: int = None) -> any:
     svc = get_service_with_rpc(server)
-    call = CallBuilder(to=util.CHAIN_SCORE, method='getNetworkInfo', params={}, height=height).build()
-    return svc.call(call)
+    return svc.call(icon_getNetworkInfo_call(height))
 
 
-def node_inspect(server: str) -> any:
-    return util.rest_get(f'http://{server}/admin/chain/icon_dex?informal=true')
+def node_inspect(server: str, timeout: float = 1.0) -> any:
+    return util.rest_get(f'http://{server}/admin/chain/icon_dex?informal=true', timeout=timeout)
 
 def node_get_chain(server: str, timeout: float = 1.0) -> any:
     return util.rest_get(f'http://{server}/admin/chain', timeout=timeout)[0]
@@ -273,9 +283,11 @@ def get_prep(obj: dict, key: str, raw: bool, bonders: bool, height: str):
     except:
         pass
 
-    preps = icon_getPReps(height=height)['preps']
-    netinfo = icon_getNetworkInfo(height=height)
-    bond_req = bond_requirement_of(netinfo)
+    with service.get_instance().batch() as batch:
+        preps = batch.call(icon_getPReps_call(height=height))
+        netinfo = batch.call(icon_getNetworkInfo_call(height=height))
+    preps = preps.result()['preps']
+    bond_req = bond_requirement_of(netinfo.result())
 
     if prep_info is None:
         prep_info = {}
@@ -311,9 +323,10 @@ def get_prep(obj: dict, key: str, raw: bool, bonders: bool, height: str):
     bonds = {}
     if bonders:
         bonder_list:dict = icon_getBonderList(prep_addr, height=height)
-        for bonder in bonder_list['bonderList']:
-            bond = icon_getBond(bonder, height=height)
-            bonds[bonder] = bond
+        with service.get_instance().batch() as batch:
+            for bonder in bonder_list['bonderList']:
+                bonds[bonder] = batch.call(icon_getBond_call(bonder, height=height))
+        bonds = { bonder: bond.result() for bonder, bond in bonds.items() }
 
     if raw :
         util.dump_json(prep_info)
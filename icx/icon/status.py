@@ -4,9 +4,15 @@ import datetime
 import json
 from concurrent import futures
 import os
+import random
+import time
+from typing import Dict, Set, Tuple
 
 import click
 from iconsdk.builder.call_builder import CallBuilder
+from rich.live import Live
+from rich.table import Table
+from rich.text import Text
 
 from .. import service
 from ..util import CHAIN_SCORE, format_decimals
@@ -15,10 +21,21 @@ from .prep import *
 
 NO_IP='-'
 
+WATCH_INTERVAL = 5.0
+WATCH_JITTER = 0.2
+WATCH_CONCURRENCY = 32
+WATCH_TICK = 0.25
+
+# version is polled once for this number of polls
+VERSION_POLLS = 12
+
 class PRep:
     def __init__(self, prep) -> None:
         self.prep = prep
         self.futures = []
+        self.server = None
+        self.chain = None
+        self.version = 'unknown'
 
 PENALTY_REASON_TO_CHECK = {
     JailFlag.Unjailing: "UnJa",
@@ -49,11 +66,178 @@ def type_of_prep(prep: dict) -> str:
             return reason[0:4]
     return GRADE_TO_TYPE[grade]
 
+def poll_node(server: str, timeout: float, with_version: bool) -> Tuple[dict, Optional[str]]:
+    chain = node_get_chain(server, timeout=timeout)
+    version = node_get_version(server, timeout=timeout) if with_version else None
+    return chain, version
+
+class StatusBoard:
+    '''
+    Table of the PRep status for "status --watch". Cells of a row are
+    built again only when the values shown in the row are changed.
+    '''
+    def __init__(self, items: List[PRep], total_preps: int, version: Optional[str]) -> None:
+        self.items = items
+        self.total_preps = total_preps
+        self.version = version
+        self.next_term = 0
+        self.top_height = 0
+        self.version_check = version
+        self.__keys: Dict[int, tuple] = {}
+        self.__rows: Dict[int, tuple] = {}
+
+    def update_summary(self):
+        last_version = None
+        for item in self.items:
+            if item.prep is None or item.chain is None:
+                continue
+            self.top_height = max(self.top_height, item.chain.get('height', 0))
+            if semanticversion.is_lower_version(last_version, item.version):
+                last_version = item.version
+        self.version_check = self.version if self.version is not None else last_version
+
+    def row_of(self, idx: int, item: PRep) -> tuple:
+        prep = item.prep
+        chain = item.chain
+        if chain is None:
+            key = (prep['name'], prep['type'], prep['ip'], prep['power'], None)
+        else:
+            height = chain.get('height')
+            late = height is not None and height < self.top_height-2
+            old = self.version_check is not None and \
+                semanticversion.is_lower_version(item.version, self.version_check)
+            key = (prep['name'], prep['type'], prep['ip'], prep['power'],
+                   item.version, old, height, chain.get('state'), late, height-self.top_height if late else 0)
+        if self.__keys.get(idx) == key:
+            return self.__rows[idx]
+
+        if prep['type'] == 'Main':
+            style = 'bold blue'
+        elif prep['type'] != 'Sub' and prep['power'] > 0 and idx < self.total_preps:
+            style = 'bold red'
+        elif prep['power'] == 0:
+            style = 'dim'
+        elif prep['ip'] == NO_IP:
+            style = 'red'
+        else:
+            style = ''
+        cells = [
+            Text(f'{idx+1}', style=style),
+            Text(prep['name'][:18], style=style),
+            Text(prep['type'], style=style),
+            Text(prep['ip'], style=style),
+            Text(format_decimals(prep['power']//10**3,0)+'k', style=style),
+        ]
+        if chain is None:
+            cells += [ Text('FAIL', style='bold yellow'), Text(''), Text('') ]
+        else:
+            _, _, _, _, version, old, height, state, late, lag = key
+            if self.version_check is None:
+                cells.append(Text(version))
+            elif old:
+                cells.append(Text(version, style='bold red'))
+            else:
+                cells.append(Text('[OK]', style='bold green'))
+            if height is None:
+                cells += [ Text(''), Text('') ]
+            elif late:
+                cells += [ Text(f'{height} ({lag})', style='bold red'), Text(f'{state}', style='bold red') ]
+            else:
+                cells += [ Text(f'{height}'), Text(f'{state}') ]
+        row = tuple(cells)
+        self.__keys[idx] = key
+        self.__rows[idx] = row
+        return row
+
+    def render(self) -> Table:
+        table = Table(box=None, header_style='bold reverse', caption_style='bold reverse')
+        for name, justify in [ ('NO', 'right'), ('Name', 'left'), ('Grade', 'left'), ('IP', 'left'),
+                               ('Power', 'right'), ('Version', 'left'), ('Height', 'right'), ('Status', 'left') ]:
+            table.add_column(name, justify=justify)
+        late_nodes = 0
+        all_nodes = 0
+        for idx, item in enumerate(self.items):
+            if item.prep is None:
+                continue
+            if item.chain is not None:
+                all_nodes += 1
+                if item.chain.get('height', self.top_height) < self.top_height-2:
+                    late_nodes += 1
+            table.add_row(*self.row_of(idx, item))
+        time_next = datetime.datetime.now() + datetime.timedelta(seconds=(self.next_term-self.top_height)*2)
+        table.caption = (f'Late: {late_nodes} / {all_nodes} | NextTerm: {self.next_term} / {time_next.strftime("%H:%M:%S")}'
+                         f' | Height: {self.top_height} | {datetime.datetime.now().strftime("%H:%M:%S")}')
+        return table
+
+def watch_status(svc: service.Service, items: List[PRep], next_term: int, total_preps: int,
+                 version: Optional[str], timeout: float, interval: float):
+    '''
+    Polls each node in the interval with jitter, and updates the table
+    when any node is changed. Connections to the nodes are kept by the
+    shared sessions of the transport.
+    '''
+    board = StatusBoard(items, total_preps, version)
+    board.next_term = next_term
+    due: Dict[int, float] = {}
+    polls: Dict[int, int] = {}
+    now = time.monotonic()
+    for idx, item in enumerate(items):
+        if item.prep is not None and item.server is not None:
+            due[idx] = now + random.uniform(0, min(interval, 1.0))
+            polls[idx] = 0
+
+    executor = futures.ThreadPoolExecutor(max_workers=WATCH_CONCURRENCY)
+    polling: Dict[futures.Future, int] = {}
+    busy: Set[int] = set()
+    try:
+        with Live(board.render(), auto_refresh=False) as live:
+            while True:
+                now = time.monotonic()
+                for idx, t in due.items():
+                    if t > now or idx in busy:
+                        continue
+                    with_version = polls[idx] % VERSION_POLLS == 0
+                    ft = executor.submit(poll_node, items[idx].server, timeout, with_version)
+                    polling[ft] = idx
+                    busy.add(idx)
+                    polls[idx] += 1
+                    due[idx] = now + interval*random.uniform(1-WATCH_JITTER, 1+WATCH_JITTER)
+
+                if len(polling) == 0:
+                    time.sleep(WATCH_TICK)
+                    continue
+                done, _ = futures.wait(polling.keys(), timeout=WATCH_TICK,
+                                       return_when=futures.FIRST_COMPLETED)
+                if len(done) == 0:
+                    continue
+                for ft in done:
+                    idx = polling.pop(ft)
+                    busy.discard(idx)
+                    item = items[idx]
+                    try:
+                        item.chain, version = ft.result()
+                        if version is not None:
+                            item.version = version
+                    except Exception:
+                        item.chain = None
+
+                board.update_summary()
+                if board.top_height >= board.next_term:
+                    iiss_info = svc.call(CallBuilder(to=CHAIN_SCORE, method="getIISSInfo").build())
+                    board.next_term = int(iiss_info['nextPRepTerm'], 0)
+                live.update(board.render(), refresh=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
 @click.command('status')
 @click.pass_obj
 @click.option('--version', type=str)
 @click.option("--timeout", type=click.FLOAT, default=1.5)
-def show_status(obj: dict, version: str, timeout: float):
+@click.option('--watch', '-w', is_flag=True, help='Keep polling the nodes and update the status')
+@click.option('--interval', type=click.FLOAT, default=WATCH_INTERVAL, help='Interval of polling for --watch in seconds')
+def show_status(obj: dict, version: str, timeout: float, watch: bool = False, interval: float = WATCH_INTERVAL):
     '''
     Show status of connected servers from SEED servers
     '''
@@ -138,15 +322,21 @@ def show_status(obj: dict, version: str, timeout: float):
         })
         if RPC in info:
             server = info[RPC]
-            future = executor.submit(node_get_chain, server, timeout=timeout)
-            results.append(future)
-            item.futures.append(future)
-            future = executor.submit(node_get_version, server, timeout=timeout)
-            results.append(future)
-            item.futures.append(future)
+            item.server = server
+            if not watch:
+                future = executor.submit(node_get_chain, server, timeout=timeout)
+                results.append(future)
+                item.futures.append(future)
+                future = executor.submit(node_get_version, server, timeout=timeout)
+                results.append(future)
+                item.futures.append(future)
         else:
             pass
         items.append(item)
+
+    if watch:
+        watch_status(svc, items, next_term, total_preps, version, timeout, interval)
+        return
     futures.as_completed(results)
 
     #-------------------------------------------------------------------------------
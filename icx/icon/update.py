@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 
+from concurrent import futures
 import json
+import os
 import re
+import stat
 import sys
-import threading
-from typing import Dict, List
+import tempfile
+import time
+from typing import Dict, List, Optional, Set, Tuple
 
 import click
 
@@ -16,13 +20,47 @@ from .. import log
 
 SEED_SERVERS = [ "52.196.159.184:7100" ]
 
+INSPECT_CONCURRENCY = 32
+INSPECT_TIMEOUT = 2.0
+
+# keys of the entry for the time of the last inspection and RTTs of them
+LAST_SEEN = 'lastSeen'
+RTTS = 'rtts'
+
+# number of RTTs kept for each node and link
+RTT_HISTORY = 10
+
+def inspect_with_rtt(rpc: str, timeout: float) -> Tuple[dict, float]:
+    '''
+    Returns the inspection and the time (in milli-second) to get it.
+    '''
+    started = time.monotonic()
+    info = node_inspect(rpc, timeout=timeout)
+    return info, (time.monotonic()-started)*1000
+
+def add_history(items: List[float], value: float) -> List[float]:
+    items.append(value)
+    del items[:-RTT_HISTORY]
+    return items
+
 class PReps:
-    def __init__(self, file: str = None):
+    '''
+    Collects P2P information of PReps by inspecting servers.
+    Inspections are fetched by at most "concurrency" workers, and they are
+    applied to "preps" only in the thread calling update_preps().
+    '''
+    def __init__(self, file: str = None, *, concurrency: int = INSPECT_CONCURRENCY,
+                 timeout: float = INSPECT_TIMEOUT):
         if file is None:
             self.preps = {}
         else:
             self.preps = json.load(file)
         self.cid = None
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.requested: Set[str] = set()
+        self.inspecting: Dict[futures.Future, Tuple[str, str]] = {}
+        self.executor: Optional[futures.Executor] = None
 
     def preps_get(self, addr: str, add: bool = True) -> Dict:
         if addr not in self.preps:
@@ -85,7 +123,7 @@ class PReps:
         if addr2 not in links:
             links[addr2] = [rtt]
         else:
-            links[addr2].append(rtt)
+            add_history(links[addr2], rtt)
 
     def preps_add_conn(self, name: str, addr: str, conn):
         RTT_REGEX=re.compile(r'{last:(?P<last>.+),avg:(?P<avg>.+)}')
@@ -96,14 +134,8 @@ class PReps:
                 rtt = duration.time_to_ms(m.group('avg'))
         self.preps_add_link(name, addr, conn['id'], rtt)
 
-    def analyze_server(self, server, src):
+    def analyze_server(self, server: str, src: str, info: dict, rtt: float):
         rpc = p2p_to_rpc(server)
-        print(f"INSPECTING {rpc}", file=sys.stderr)
-        try:
-            info = node_inspect(rpc)
-        except:
-            return
-
         if self.cid is None:
             self.cid = info['cid']
             print(f'[{server}] SET NETWORK cid={info["cid"]}')
@@ -115,9 +147,13 @@ class PReps:
         p2p = info["module"]["network"]["p2p"]
         addr = p2p['self']['id']
 
-        self.preps_update_p2p(server, addr, p2p['self']['addr'], True)
         prep = self.preps_get(addr)
+        if prep.get(P2P, p2p['self']['addr']) != p2p['self']['addr']:
+            print(f"[{server}] CHANGED {addr} old={prep[P2P]} new={p2p['self']['addr']}", file=sys.stderr)
+        prep[P2P] = p2p['self']['addr']
         prep[RPC] = rpc
+        prep[LAST_SEEN] = int(time.time())
+        prep[RTTS] = add_history(prep.get(RTTS, []), round(rtt, 3))
 
         if 'roots' in p2p:
             founds = self.preps_apply_map(server, p2p['roots'], 'Main')
@@ -146,7 +182,13 @@ class PReps:
             if parent and 'id' in parent:
                 self.preps_add_conn('links', addr, parent)
 
-    def update_preps(self, seed: List[str]):
+    def update_preps(self, seed: List[str], ttl: float = None):
+        '''
+        Update PRep information from the seed servers. If ttl (in seconds)
+        is given, it inspects only servers not inspected within the ttl.
+        Known servers which are stale or never inspected successfully are
+        inspected again.
+        '''
         if len(seed) == 0:
             raise Exception("No seed information")
         main_prep_info = None
@@ -181,32 +223,85 @@ class PReps:
                 entry['grade'] = 'Cand'
             idx += 1
 
-        self.threads: List[threading.Thread]=[]
-        for server in seed:
-            self.inspect_server(server, 'seed')
-
-        while len(self.threads)>0:
-            th = self.threads.pop(0)
-            th.join()
+        servers = list(seed)
+        if ttl is not None:
+            expire = time.time() - ttl
+            fresh = set()
+            for prep in self.preps.values():
+                if P2P not in prep:
+                    continue
+                if prep.get(LAST_SEEN, 0) >= expire:
+                    fresh.add(prep[P2P])
+                else:
+                    servers.append(prep[P2P])
+            self.requested.update(fresh)
+            print(f'SKIP {len(fresh)} servers inspected within {ttl}s', file=sys.stderr)
+
+        with futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            self.executor = executor
+            for server in servers:
+                self.inspect_server(server, 'seed')
+            while len(self.inspecting) > 0:
+                done, _ = futures.wait(self.inspecting.keys(), return_when=futures.FIRST_COMPLETED)
+                for ft in done:
+                    server, src = self.inspecting.pop(ft)
+                    try:
+                        info, rtt = ft.result()
+                    except Exception:
+                        continue
+                    self.analyze_server(server, src, info, rtt)
+            self.executor = None
 
     def inspect_server(self, ip:str, src:str):
-        if is_private_p2p(ip):
+        if is_private_p2p(ip) or ip in self.requested:
             return
-        th = threading.Thread(target=self.analyze_server, args=[ip, src])
-        self.threads.append(th)
-        th.start()
+        self.requested.add(ip)
+        rpc = p2p_to_rpc(ip)
+        print(f"INSPECTING {rpc}", file=sys.stderr)
+        ft = self.executor.submit(inspect_with_rtt, rpc, self.timeout)
+        self.inspecting[ft] = (ip, src)
 
     def dump_to(self, file: str):
-        with open(file, "w") as fd:
-            print(json.dumps(self.preps, indent=2), file=fd)
+        # write to temporary file then replace, so readers never see partial one
+        mode = file_mode(file)
+        fd, tmp = tempfile.mkstemp(dir=path.dirname(file) or '.', prefix=path.basename(file)+'.')
+        try:
+            # mkstemp creates it with 0600, so keep the mode of the replaced one
+            os.fchmod(fd, mode)
+            with os.fdopen(fd, "w") as fp:
+                print(json.dumps(self.preps, indent=2), file=fp)
+            os.replace(tmp, file)
+        except:
+            os.unlink(tmp)
+            raise
+
+def file_mode(file: str) -> int:
+    '''
+    Returns permission bits of the file, or the ones for a new file
+    (by the umask) if it doesn't exist.
+    '''
+    try:
+        return stat.S_IMODE(os.stat(file).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
 
 @click.command('update')
 @click.pass_obj
 @click.argument('server', nargs=-1)
-def update_preps_json(obj: dict, server: List[str]):
+@click.option('--concurrency', type=click.INT, default=INSPECT_CONCURRENCY, help='Number of servers to inspect concurrently')
+@click.option('--timeout', type=click.FLOAT, default=INSPECT_TIMEOUT, help='Timeout of inspection in seconds')
+@click.option('--incremental', '-i', is_flag=True, help='Update the existing store, inspecting only stale servers')
+@click.option('--ttl', type=click.FLOAT, default=3600, help='Seconds until inspected server becomes stale (with --incremental)')
+def update_preps_json(obj: dict, server: List[str], concurrency: int = INSPECT_CONCURRENCY,
+                      timeout: float = INSPECT_TIMEOUT, incremental: bool = False, ttl: float = 3600):
     '''
     Update connected P2P server information from SERVER
 
+    With "--incremental", it keeps the existing information and inspects
+    only the servers not inspected within TTL seconds.
+
     SERVER is <ip>:<port> to the P2P endpoint of the node
     It tries to use RPC endpoint <ip>:<port+1900> for inspection
 
@@ -214,7 +309,15 @@ def update_preps_json(obj: dict, server: List[str]):
     '''
     store = path.expanduser(obj[CONTEXT_PREP_STORE])
 
-    preps = PReps()
+    preps = None
+    if incremental:
+        try:
+            with open(store, "r") as fd:
+                preps = PReps(fd, concurrency=concurrency, timeout=timeout)
+        except FileNotFoundError:
+            pass
+    if preps is None:
+        preps = PReps(concurrency=concurrency, timeout=timeout)
     if len(server) == 0:
         try :
             with open(store, "r") as fd:
@@ -226,5 +329,5 @@ def update_preps_json(obj: dict, server: List[str]):
         if len(server) == 0:
             raise click.ClickException('No seed information')
 
-    preps.update_preps(server)
+    preps.update_preps(server, ttl if incremental else None)
     preps.dump_to(store)
@@ -4,6 +4,7 @@ from collections.abc import Iterable
 from concurrent import futures
 import json
 import sys
+import time
 from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlparse, ParseResult
 
@@ -17,6 +18,13 @@ P2P_TO_RPC = {
     7120: 9020,
 }
 
+INSPECT_CONCURRENCY = 32
+INSPECT_TIMEOUT = 2.0
+INSPECT_RETRIES = 2
+INSPECT_BACKOFF = 0.2
+NODE_DEADLINE = 5.0
+CRAWL_DEADLINE = 60.0
+
 def is_private_ip(host: str) -> bool:
     ip = list(map(lambda x: int(x), host.split('.')))
     return ip[0] == 10 \
@@ -100,9 +108,9 @@ class Node:
         name = self.get_channel_name_for_cid(cid)
         return self.get_url(f'/api/v3/{name}')
 
-    def get_channel_info(self) -> Dict[str,any]:
+    def get_channel_info(self, **kwargs) -> Dict[str,any]:
         if self.__channel_info is None:
-            channels: List[dict] = util.rest_get(self.get_url('/admin/chain'))
+            channels: List[dict] = util.rest_get(self.get_url('/admin/chain'), **kwargs)
             channel_info = {}
             for channel in channels:
                 channel_info[channel['cid']] = channel
@@ -139,6 +147,7 @@ class Node:
             raise Exception(f'fail to GET url={url}') from exc
 
     def get_inspection(self, cid: str, **kwargs) -> Inspection:
+        self.get_channel_info(**kwargs)
         if not self.is_valid_cid(cid):
             raise Exception(f'invalid cid={cid}')
         if cid not in self.__inspections:
@@ -198,27 +207,46 @@ class NodeReport:
         return len(self.reporters)
 
 class NetworkInformation:
-    def __init__(self, cid: str, verbose: bool = False, public_only: bool = False) -> None:
+    '''
+    Crawls nodes of the network breadth first. Inspections are fetched by
+    at most "concurrency" workers, and they are applied in the thread
+    calling process_all(), so reports are updated by one thread.
+    '''
+    def __init__(self, cid: str, verbose: bool = False, public_only: bool = False, *,
+                 concurrency: int = INSPECT_CONCURRENCY,
+                 timeout: float = INSPECT_TIMEOUT,
+                 retries: int = INSPECT_RETRIES,
+                 node_deadline: float = NODE_DEADLINE) -> None:
         self.cid = cid
         self.verbose = verbose
         self.public_only = public_only
+        self.timeout = timeout
+        self.retries = retries
+        self.node_deadline = node_deadline
         self.p2pToNode: Dict[str,Node] = {}
         self.idToNode: Dict[str,List[NodeReport]] = {}
-        self.inspectingQueue  = []
-        self.executor = futures.ThreadPoolExecutor()
-
-    def inspect(self, node: Node, **kwargs):
-        if self.public_only and node.is_private:
-            return
-        try :
-            print(f'\033[KInspecting [{node}]\r', end='', flush=True, file=sys.stderr)
-            inspection = node.get_inspection(self.cid)
-        except Exception as e:
-            if self.verbose:
-                print(f'\033[KFAIL to inspect [{node}] err={e}',
-                    flush=True, file=sys.stderr)
-            return
-        self.process_inspection(inspection, node)
+        self.inspecting: Dict[futures.Future, Node] = {}
+        self.failures: Dict[str, Exception] = {}
+        self.unfinished: List[Node] = []
+        self.executor = futures.ThreadPoolExecutor(max_workers=concurrency)
+
+    def inspect(self, node: Node) -> Inspection:
+        '''
+        Returns inspection of the node. It retries with backoff on failure
+        until it reaches the retry limit or the deadline for the node.
+        '''
+        deadline = time.monotonic() + self.node_deadline
+        backoff = INSPECT_BACKOFF
+        for retry in range(self.retries+1):
+            remains = deadline - time.monotonic()
+            try:
+                return node.get_inspection(self.cid, timeout=min(self.timeout, max(remains, 0.1)))
+            except Exception:
+                remains = deadline - time.monotonic()
+                if retry == self.retries or remains <= backoff:
+                    raise
+            time.sleep(backoff)
+            backoff *= 2
 
     def report_address(self, node: Node, addr: str, reporter: Node, real: bool = False):
         if addr not in self.idToNode:
@@ -233,8 +261,10 @@ class NetworkInformation:
             nodes.append(NodeReport(node, reporter, real))
 
     def request_inspect(self, node):
-        ft = self.executor.submit(self.inspect, node, timeout=2.0)
-        self.inspectingQueue.append(ft)
+        if self.public_only and node.is_private:
+            return
+        ft = self.executor.submit(self.inspect, node)
+        self.inspecting[ft] = node
 
     def report_p2p(self, server: str, need_inspect: bool = True, uri: Optional[str] = None) -> Node:
         if server not in self.p2pToNode:
@@ -287,14 +317,36 @@ class NetworkInformation:
                 n = self.report_p2p(parent['addr'], True)
                 self.report_address(n, parent['id'], node, not parent['in'])
 
-    def process_all(self):
-        while len(self.inspectingQueue) > 0:
-            item: futures.Future = self.inspectingQueue.pop(0)
-            try:
-                item.result()
-            except:
-                futures.as_completed(self.inspectingQueue)
-                raise
+    def process_all(self, deadline: Optional[float] = CRAWL_DEADLINE):
+        '''
+        Apply inspections until all the reported nodes are inspected
+        or the deadline (in seconds) passes. Nodes not inspected by then
+        are kept in "unfinished".
+        '''
+        end = None if deadline is None else time.monotonic() + deadline
+        while len(self.inspecting) > 0:
+            timeout = None if end is None else end - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
+            done, _ = futures.wait(self.inspecting.keys(), timeout=timeout,
+                                   return_when=futures.FIRST_COMPLETED)
+            for ft in done:
+                node = self.inspecting.pop(ft)
+                try:
+                    inspection = ft.result()
+                except Exception as e:
+                    self.failures[node.p2p] = e
+                    if self.verbose:
+                        print(f'\033[KFAIL to inspect [{node}] err={e}',
+                            flush=True, file=sys.stderr)
+                    continue
+                print(f'\033[KInspected [{node}] remains={len(self.inspecting)}\r',
+                      end='', flush=True, file=sys.stderr)
+                self.process_inspection(inspection, node)
+        print('\033[K', end='', flush=True, file=sys.stderr)
+        self.unfinished = list(self.inspecting.values())
+        self.inspecting.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
     def show_inspection(self):
         problems: Dict[str,Problem] = {}
@@ -340,7 +392,8 @@ class NetworkInformation:
             if node.has_inspection(self.cid):
                 inspected += 1
 
-        print(f'Summary servers:{len(self.p2pToNode)} wallets:{len(self.idToNode)} inspected:{inspected}')
+        print(f'Summary servers:{len(self.p2pToNode)} wallets:{len(self.idToNode)} inspected:{inspected}'
+              f' failed:{len(self.failures)} unfinished:{len(self.unfinished)}')
 
 def inspect_url_of(obj: dict, server: str = None, rpc: str = None, channel: str = None, informal: bool = False) -> ParseResult:
     if rpc is None:
@@ -385,10 +438,21 @@ def show_inspection(obj: dict, server: str = None, rpc: str = None, channel: str
 @click.option('--channel', type=click.STRING)
 @click.option('--server', type=click.STRING)
 @click.option('--private', is_flag=True)
+@click.option('--verbose', '-v', is_flag=True, help='Show failures of nodes')
+@click.option('--concurrency', type=click.INT, default=INSPECT_CONCURRENCY, help='Number of nodes to inspect concurrently')
+@click.option('--timeout', type=click.FLOAT, default=INSPECT_TIMEOUT, help='Timeout of each request in seconds')
+@click.option('--retries', type=click.INT, default=INSPECT_RETRIES, help='Number of retries for each node')
+@click.option('--node-deadline', type=click.FLOAT, default=NODE_DEADLINE, help='Time limit for each node in seconds')
+@click.option('--deadline', type=click.FLOAT, default=CRAWL_DEADLINE, help='Time limit for all nodes in seconds (0 for no limit)')
 @click.pass_obj
-def show_netinspection(obj: dict, server: str = None, rpc: str = None, channel: str = None, private: bool = False):
+def show_netinspection(obj: dict, server: str = None, rpc: str = None, channel: str = None, private: bool = False,
+                       verbose: bool = False, concurrency: int = INSPECT_CONCURRENCY, timeout: float = INSPECT_TIMEOUT,
+                       retries: int = INSPECT_RETRIES, node_deadline: float = NODE_DEADLINE,
+                       deadline: float = CRAWL_DEADLINE):
     '''
     Inspect the channel of the all nodes connected with the server
+
+    Nodes not inspected until the deadline are shown with their reports.
     '''
     url_obj = inspect_url_of(obj, server, rpc, channel)
     uri_obj = url_obj._replace(path="")
@@ -398,8 +462,10 @@ def show_netinspection(obj: dict, server: str = None, rpc: str = None, channel:
     except BaseException as exc:
         raise Exception(f'fail to get inspection with url={url}') from exc
 
-    info = NetworkInformation(inspection.cid, public_only=(not private))
+    info = NetworkInformation(inspection.cid, verbose=verbose, public_only=(not private),
+                              concurrency=concurrency, timeout=timeout,
+                              retries=retries, node_deadline=node_deadline)
     node = info.report_p2p(inspection.p2p, False, uri_obj.geturl())
     info.process_inspection(inspection, node)
-    info.process_all()
+    info.process_all(deadline if deadline > 0 else None)
     info.show_inspection()
\ No newline at end of file
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+'''
+Logs bloom of goloop (service/txresult/logsbloom.go in icon-project/goloop).
+
+  - 2048 bits, stored as the big-endian integer of the bits.
+  - An event log adds the address of the SCORE (0xff + 21 bytes of the
+    address), and each indexed value (index byte + bytes of the value).
+  - Each item sets 3 bits, taken from the first 3 pairs of bytes of
+    sha3_256(item), masked to the width.
+
+The header of a block has the bloom of the transactions of the previous
+block. txscan verifies the layout with event logs of the first blocks
+before it skips any block (see txscan.verify_bloom).
+'''
+
+from hashlib import sha3_256
+from typing import Iterable, List, Tuple
+
+LOGS_BLOOM_BITS = 2048
+LOGS_BLOOM_HASHES = 3
+
+# tag prefixed to the address of the SCORE emitting the event
+ADDRESS_TAG = 0xff
+
+def address_to_bytes(addr: str) -> bytes:
+    return bytes([1 if addr.startswith('cx') else 0]) + bytes.fromhex(addr[2:])
+
+def bloom_bits(item: bytes) -> Tuple[int, ...]:
+    h = sha3_256(item).digest()
+    return tuple((h[i*2] << 8 | h[i*2+1]) & (LOGS_BLOOM_BITS-1) for i in range(LOGS_BLOOM_HASHES))
+
+def address_bits(addr: str) -> Tuple[int, ...]:
+    return bloom_bits(bytes([ADDRESS_TAG]) + address_to_bytes(addr))
+
+def indexed_bits(idx: int, value: bytes) -> Tuple[int, ...]:
+    return bloom_bits(bytes([idx]) + value)
+
+def event_log_bits(log: dict) -> List[Tuple[int, ...]]:
+    '''
+    Returns bits of the address and the signature of the event log
+    (in the transaction result). Other indexed values are not included,
+    since their bytes depend on the types of the parameters.
+    '''
+    return [ address_bits(log['scoreAddress']), indexed_bits(0, log['indexed'][0].encode()) ]
+
+class LogsBloom:
+    '''
+    Logs bloom in the block header. It's the big-endian integer of
+    the bloom bits (leading zero bytes may be omitted).
+    '''
+    def __init__(self, bs: bytes) -> None:
+        self.__value = int.from_bytes(bs, byteorder='big')
+
+    def contains(self, bits: Iterable[int]) -> bool:
+        for bit in bits:
+            if (self.__value >> bit) & 1 == 0:
+                return False
+        return True
+
+    def contains_all(self, bits_list: List[Tuple[int, ...]]) -> bool:
+        for bits in bits_list:
+            if not self.contains(bits):
+                return False
+        return True
+
+    def contains_any(self, bits_list: List[Tuple[int, ...]]) -> bool:
+        for bits in bits_list:
+            if self.contains(bits):
+                return True
+        return False
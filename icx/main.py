@@ -6,12 +6,13 @@ from typing import List
 
 import click
 
-from . import (basic, blockinterval, blockvotes, btp, call, icon, inspect,
-               network, rlp, scoreapi, service, trace, txscan, verifytx,
-               wallet)
+from . import (basic, blockdata, blockinterval, blockvotes, btp, call, icon,
+               inspect, network, rlp, scoreapi, service, trace, transport,
+               txindex, txscan, verifytx, wallet)
+from .blockcache import CACHE_FILE, DEFAULT_MAX_SIZE, BlockCache
 from .config import CONTEXT_CONFIG, Config
 from .market import exchange
-from .util import datetime_from_ts, format_dt
+from .util import INT, datetime_from_ts, format_dt
 
 CONFIG_NETWORKS='networks'
 
@@ -35,12 +36,39 @@ CONFIG_NETWORKS='networks'
             metavar="<exchanges.json>",
             help="Authentication credentials for the exchanges",
 )
+@click.option('--no-cache', 'no_cache', envvar='ICX_NO_CACHE', is_flag=True,
+             help='Do not use local cache of blocks')
+@click.option('--cache-size', envvar='ICX_CACHE_SIZE', type=INT,
+             default=DEFAULT_MAX_SIZE//(1024*1024), metavar='<MB>',
+             help='Maximum size of local cache of blocks in MB')
+@click.option('--rpc-timeout', envvar='ICX_RPC_TIMEOUT', type=click.FLOAT,
+             default=transport.DEFAULT_TIMEOUT, metavar='<seconds>',
+             help='Timeout of RPC requests')
+@click.option('--rpc-pool', envvar='ICX_RPC_POOL', type=INT,
+             default=transport.DEFAULT_POOL_SIZE, metavar='<size>',
+             help='Maximum connections to keep for each RPC endpoint')
+@click.option('--rpc-keepalive', envvar='ICX_RPC_KEEPALIVE', type=INT,
+             default=transport.DEFAULT_KEEPALIVE, metavar='<seconds>',
+             help='Idle time before TCP keep-alive probes (0 to disable)')
+@click.option('--verbose', '-v', envvar='ICX_VERBOSE', is_flag=True,
+             help='Show hits and misses of memoized calls on exit')
 @click.pass_context
-def main(ctx: click.Context, net: str = None, url: str = None, nid: str = None, config: str = None, ks: str = None, auth: str = None):
+def main(ctx: click.Context, net: str = None, url: str = None, nid: str = None, config: str = None, ks: str = None, auth: str = None,
+         no_cache: bool = False, cache_size: int = None,
+         rpc_timeout: float = None, rpc_pool: int = None, rpc_keepalive: int = None,
+         verbose: bool = False):
     ctx.ensure_object(dict)
-    config = path.join(click.get_app_dir('ICX'), 'config.json') if config is None else config
+    if verbose:
+        ctx.call_on_close(show_call_stats)
+    transport.configure(pool_size=rpc_pool, timeout=rpc_timeout, keepalive=rpc_keepalive)
+    app_dir = click.get_app_dir('ICX')
+    config = path.join(app_dir, 'config.json') if config is None else config
     ctx_config = Config(config)
     ctx.obj[CONTEXT_CONFIG] = ctx_config
+    if not no_cache:
+        cache = BlockCache(path.join(app_dir, CACHE_FILE), cache_size*1024*1024)
+        service.set_cache(cache)
+        ctx.call_on_close(cache.flush)
     if url is not None and nid is not None:
         service.set_default(url, int(nid, 0))
     elif net is not None:
@@ -50,6 +78,12 @@ def main(ctx: click.Context, net: str = None, url: str = None, nid: str = None,
     if auth is not None:
         exchange.handleFlag(ctx.obj, auth)
 
+def show_call_stats():
+    for url, svc in service.cached_service.items():
+        stats = svc.call_stats
+        click.secho(f'Calls url={url} hits={stats["hits"]} misses={stats["misses"]}',
+                    fg='bright_black', err=True)
+
 @click.command('time')
 @click.argument('timestamp', type=click.STRING, nargs=-1)
 @click.option('--utc', is_flag=True, default=False)
@@ -89,6 +123,7 @@ main.add_command(trace.get_trace, 'trace')
 main.add_command(btp.main, 'btp')
 main.add_command(blockinterval.block_interval, 'interval')
 main.add_command(txscan.scan, 'txscan')
+main.add_command(txindex.build_index, 'txindex')
 main.add_command(rlp.rlp_endecode, 'rlp')
 main.add_command(rlp.hex_endecode, 'hex')
 main.add_command(call.call, 'call')
@@ -100,6 +135,7 @@ main.add_command(time_convert, 'time')
 main.add_command(blockvotes.check_votes, 'votes')
 main.add_command(verifytx.verify_tx, 'verifytx')
 main.add_command(blockvotes.show_validators, 'validators')
+main.add_command(blockdata.show_participation, 'participation')
 main.add_command(inspect.show_inspection, 'inspect')
 main.add_command(inspect.show_netinspection, 'netinspect')
 
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+from collections import deque
+from concurrent import futures
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+DEFAULT_THREADS = 6
+
+def ordered_map(func: Callable[[T], R], items: Iterable[T], *,
+                threads: int = DEFAULT_THREADS, window: int = None) -> Iterator[R]:
+    '''
+    Apply func to items with a thread pool, and yield results in the order
+    of items. At most "window" calls are kept in flight, so items may be
+    an infinite iterator. An exception of the call is raised when its
+    result is reached, and pending calls are cancelled.
+    '''
+    if threads < 1:
+        raise ValueError(f'InvalidThreads({threads})')
+    if window is None or window < threads:
+        window = threads
+    items = iter(items)
+    executor = futures.ThreadPoolExecutor(max_workers=threads)
+    pending: deque[futures.Future] = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= window:
+                break
+        while len(pending) > 0:
+            ft = pending.popleft()
+            for item in items:
+                pending.append(executor.submit(func, item))
+                break
+            yield ft.result()
+    finally:
+        for ft in pending:
+            ft.cancel()
+        executor.shutdown(wait=False)
@@ -2,52 +2,159 @@
 
 import io
 import json
-from typing import Tuple, List, Union
+from collections.abc import Sequence
+from typing import Any, Tuple, List, Optional, Union
 
 import click
 from . import util
 
 RLPValue = Union[bytes,List['RLPValue'],None]
 
-def decode_list_bytes(bs: bytes) -> List[RLPValue]:
-    items = []
-    while len(bs)>0:
-        obj, bs = decode_one_bytes(bs)
-        items.append(obj)
-    return items
+class EndOfFile(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
 
-def decode_one_bytes(bs: bytes) -> Tuple[RLPValue, bytes]:
-    ch, bs = bs[0], bs[1:]
+class NotEnoughData(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+# Kinds of items returned by decode_header()
+BYTES = 0
+LIST = 1
+NULL = 2
+
+def decode_header(bs: memoryview, offset: int) -> Tuple[int, int, int]:
+    '''
+    Decode the header of the item at offset.
+    It returns (kind, start, end) of the payload.
+    '''
+    if offset >= len(bs):
+        raise NotEnoughData(f'NotEnoughData(offset={offset},size={len(bs)})')
+    ch = bs[offset]
+    offset += 1
     if ch < 0x80:
-        return bytes([ch]), bs
+        kind, start, size = BYTES, offset-1, 1
     elif ch < 0xB8:
-        size = ch-0x80
-        return bs[:size], bs[size:]
+        kind, start, size = BYTES, offset, ch-0x80
     elif ch < 0xC0:
         tag_size = ch - 0xB7
-        tag, bs = bs[:tag_size], bs[tag_size:]
-        size = int.from_bytes(tag, signed=False, byteorder='big')
-        return bs[:size], bs[size:]
+        size = int.from_bytes(bs[offset:offset+tag_size], signed=False, byteorder='big')
+        kind, start = BYTES, offset+tag_size
     elif ch < 0xF8:
-        size = ch - 0xC0
-        list_bytes, bs = bs[:size], bs[size:]
-        return decode_list_bytes(list_bytes), bs
+        kind, start, size = LIST, offset, ch-0xC0
     else:
         tag_size = ch - 0xF7
-        tag, bs = bs[:tag_size], bs[tag_size:]
-        size = int.from_bytes(tag, signed=False, byteorder='big')
-        if size == 0:
-            return None, bs
-        list_bytes, bs = bs[:size], bs[size:]
-        return decode_list_bytes(list_bytes), bs
+        size = int.from_bytes(bs[offset:offset+tag_size], signed=False, byteorder='big')
+        kind, start = (LIST if size > 0 else NULL), offset+tag_size
+    end = start+size
+    if end > len(bs):
+        raise NotEnoughData(f'NotEnoughData(size={end},read={len(bs)})')
+    return kind, start, end
 
-class EndOfFile(Exception):
-    def __init__(self, *args: object) -> None:
-        super().__init__(*args)
+def decode_at(bs: memoryview, offset: int) -> Tuple[RLPValue, int]:
+    '''
+    Decode the item at offset, and returns the item and the offset of next.
+    '''
+    kind, start, end = decode_header(bs, offset)
+    if kind == BYTES:
+        return bytes(bs[start:end]), end
+    elif kind == LIST:
+        return decode_list_at(bs, start, end), end
+    else:
+        return None, end
 
-class NotEnoughData(Exception):
-    def __init__(self, *args: object) -> None:
-        super().__init__(*args)
+def decode_list_at(bs: memoryview, start: int, end: int) -> List[RLPValue]:
+    items = []
+    while start < end:
+        obj, start = decode_at(bs, start)
+        items.append(obj)
+    if start > end:
+        raise Exception(f'InvalidListSize(end={end},next={start})')
+    return items
+
+def decode_list_bytes(bs: bytes) -> List[RLPValue]:
+    mv = memoryview(bs)
+    return decode_list_at(mv, 0, len(mv))
+
+def decode_one_bytes(bs: bytes) -> Tuple[RLPValue, bytes]:
+    mv = memoryview(bs)
+    obj, offset = decode_at(mv, 0)
+    return obj, bytes(mv[offset:])
+
+class RLPListView(Sequence):
+    '''
+    Lazily decoded RLP list. It keeps the view of the encoded bytes, and
+    decodes items only when they are accessed. Nested lists are also
+    returned as RLPListView.
+    '''
+    def __init__(self, bs: memoryview, start: int, end: int) -> None:
+        self.__bs = bs
+        self.__start = start
+        self.__end = end
+        self.__offsets: Optional[List[int]] = None
+
+    def __get_offsets(self) -> List[int]:
+        if self.__offsets is None:
+            offsets = []
+            offset = self.__start
+            while offset < self.__end:
+                offsets.append(offset)
+                _, _, offset = decode_header(self.__bs, offset)
+            self.__offsets = offsets
+        return self.__offsets
+
+    def __len__(self) -> int:
+        return len(self.__get_offsets())
+
+    def __getitem__(self, idx):
+        offsets = self.__get_offsets()
+        if isinstance(idx, slice):
+            return [ self.__item_at(offset) for offset in offsets[idx] ]
+        return self.__item_at(offsets[idx])
+
+    def __item_at(self, offset: int) -> Any:
+        kind, start, end = decode_header(self.__bs, offset)
+        if kind == BYTES:
+            return bytes(self.__bs[start:end])
+        elif kind == LIST:
+            return RLPListView(self.__bs, start, end)
+        else:
+            return None
+
+    def raw(self) -> memoryview:
+        '''
+        Returns the view of the encoded payload of the list.
+        '''
+        return self.__bs[self.__start:self.__end]
+
+    def materialize(self) -> List[RLPValue]:
+        return decode_list_at(self.__bs, self.__start, self.__end)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, RLPListView):
+            other = other.materialize()
+        if isinstance(other, (list, tuple)):
+            return self.materialize() == list(other)
+        return False
+
+    def __repr__(self) -> str:
+        return f'RLPListView({self.materialize()!r})'
+
+def decode_lazy(bs: bytes) -> Union[RLPValue, RLPListView]:
+    '''
+    Decode RLP bytes lazily. A list is returned as RLPListView which decodes
+    items on access, so only accessed items of large lists are decoded.
+    '''
+    mv = memoryview(bs)
+    kind, start, end = decode_header(mv, 0)
+    if end != len(mv):
+        raise Exception(f'RemainingBytes(size={len(mv)-end}')
+    if kind == BYTES:
+        return bytes(mv[start:end])
+    elif kind == LIST:
+        return RLPListView(mv, start, end)
+    else:
+        return None
 
 def decode_list(fd: io.RawIOBase) -> List[RLPValue]:
     items = []
@@ -82,23 +189,22 @@ def decode(fd: io.RawIOBase) -> RLPValue:
         return read_full(fd, size)
     elif ch < 0xF8:
         size = ch - 0xC0
-        bs = read_full(fd, size)
-        cfd = io.BytesIO(bs)
-        return decode_list(cfd)
+        bs = memoryview(read_full(fd, size))
+        return decode_list_at(bs, 0, len(bs))
     else:
         tag_size = ch - 0xF7
         tag = read_full(fd, tag_size)
         size = int.from_bytes(tag, signed=False, byteorder='big')
         if size == 0:
             return None
-        bs = read_full(fd, size)
-        cfd = io.BytesIO(bs)
-        return decode_list(cfd)
+        bs = memoryview(read_full(fd, size))
+        return decode_list_at(bs, 0, len(bs))
 
 def decode_bytes(bs: bytes) -> RLPValue:
-    obj, bs = decode_one_bytes(bs)
-    if len(bs) > 0:
-        raise Exception(f'RemainingBytes(size={len(bs)}')
+    mv = memoryview(bs)
+    obj, offset = decode_at(mv, 0)
+    if offset < len(mv):
+        raise Exception(f'RemainingBytes(size={len(mv)-offset}')
     return obj
 
 
@@ -115,31 +221,88 @@ def encode_bytes(bs: bytes) -> bytes:
         tag = blen.to_bytes(tag_size, byteorder='big', signed=False,)
         return head+tag+bs
 
-def encode(obj: RLPValue) -> bytes:
-    if obj is None:
-        return b'\xf8\x00'
-    elif isinstance(obj, bytes):
-        return encode_bytes(obj)
+def to_bytes(obj: Union[bytes,bytearray,memoryview,str]) -> bytes:
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return obj
     elif isinstance(obj, str):
         if obj.startswith('0x'):
-            return encode_bytes(bytes.fromhex(obj[2:]))
+            return bytes.fromhex(obj[2:])
         else:
             raise Exception(f'UnknownString({obj})')
-    elif isinstance(obj, list) or isinstance(obj, tuple):
-        bs = b''
+    else:
+        raise Exception(f'UnknownType({obj})')
+
+def header_size(size: int) -> int:
+    return 1 if size <= 55 else 1+(size.bit_length()+7)//8
+
+def measure(obj: RLPValue, sizes: List[int]) -> int:
+    '''
+    Returns the size of encoded obj, and appends the payload sizes of lists
+    to sizes in the order of the encoding.
+    '''
+    if obj is None:
+        return 2
+    elif isinstance(obj, (list, tuple)):
+        idx = len(sizes)
+        sizes.append(0)
+        size = 0
         for item in obj:
-            bs += encode(item)
+            size += measure(item, sizes)
+        sizes[idx] = size
+        return header_size(size)+size
+    else:
+        bs = to_bytes(obj)
         blen = len(bs)
-        if blen <= 55:
-            head = bytes([0xC0+blen])
-            return head+bs
-        else:
-            tag_size = (blen.bit_length()+7)//8
-            head = bytes([0xC0+55+tag_size])
-            tag = blen.to_bytes(tag_size, byteorder='big', signed=False,)
-            return head+tag+bs
+        if blen == 1 and bs[0] < 0x80:
+            return 1
+        return header_size(blen)+blen
+
+def write_header(mv: memoryview, pos: int, base: int, size: int) -> int:
+    if size <= 55:
+        mv[pos] = base+size
+        return pos+1
+    tag_size = (size.bit_length()+7)//8
+    mv[pos] = base+55+tag_size
+    mv[pos+1:pos+1+tag_size] = size.to_bytes(tag_size, byteorder='big', signed=False)
+    return pos+1+tag_size
+
+def write_item(mv: memoryview, pos: int, obj: RLPValue, sizes: List[int], idx: int) -> Tuple[int, int]:
+    if obj is None:
+        mv[pos:pos+2] = b'\xf8\x00'
+        return pos+2, idx
+    elif isinstance(obj, (list, tuple)):
+        pos = write_header(mv, pos, 0xC0, sizes[idx])
+        idx += 1
+        for item in obj:
+            pos, idx = write_item(mv, pos, item, sizes, idx)
+        return pos, idx
     else:
-        raise Exception(f'UnknownType({obj})')
+        bs = to_bytes(obj)
+        blen = len(bs)
+        if blen == 1 and bs[0] < 0x80:
+            mv[pos] = bs[0]
+            return pos+1, idx
+        pos = write_header(mv, pos, 0x80, blen)
+        mv[pos:pos+blen] = bs
+        return pos+blen, idx
+
+def encode_into(buf: bytearray, obj: RLPValue) -> int:
+    '''
+    Append encoded obj to buf, and returns the number of bytes written.
+    Sizes are measured first, so buf is extended only once.
+    '''
+    sizes = []
+    size = measure(obj, sizes)
+    start = len(buf)
+    buf.extend(bytes(size))
+    with memoryview(buf) as mv:
+        write_item(mv, start, obj, sizes, 0)
+    return size
+
+def encode(obj: RLPValue) -> bytes:
+    buf = bytearray()
+    encode_into(buf, obj)
+    return bytes(buf)
 
 
 @click.command(help='Decode/encode RLP bytes to/from JSON')
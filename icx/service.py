@@ -1,20 +1,38 @@
 #!/usr/bin/env python3
 
 
+import copy
+import json
 import os
+import threading
+import time
+from concurrent import futures
 from time import sleep
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
-from iconsdk.builder.call_builder import CallBuilder
+import requests
+from iconsdk.builder.call_builder import Call, CallBuilder
 from iconsdk.builder.transaction_builder import CallTransactionBuilder
+from iconsdk.exception import HTTPError, JSONRPCException
 from iconsdk.icon_service import IconService, SignedTransaction, Transaction
 from iconsdk.providers.http_provider import HTTPProvider
+from iconsdk.utils.converter import convert
+from iconsdk.utils.templates import TRANSACTION
 from iconsdk.wallet.wallet import KeyWallet, Wallet
 
+from . import transport
+from .blockcache import BlockCache
 from .util import CHAIN_SCORE
 
 MAINNET_URL = 'https://ctz.solidwallet.io/api/v3/icon_dex'
 MAINNET_NID = '0x1'
 
+# seconds to reuse results of calls for the latest state
+CALL_TTL = 1.0
+
+# returned by the cache for missing entries, as None can be a cached value
+MISSING = object()
+
 
 class FailureAfterSend(Exception):
     def __init__(self, tx_hash: str, *args: object) -> None:
@@ -36,15 +54,256 @@ class TransactionFailure(FailureAfterSend):
         return self.__result
 
 
+def call_params(call: Call) -> dict:
+    '''
+    Returns params of icx_call for the call, same as IconService.call().
+    (Call returns params and height already converted to strings)
+    '''
+    params = {
+        'to': call.to,
+        'dataType': 'call',
+        'data': { 'method': call.method },
+    }
+    if call.from_ is not None:
+        params['from'] = call.from_
+    if isinstance(call.params, dict):
+        params['data']['params'] = call.params
+    if call.height is not None:
+        params['height'] = call.height
+    return params
+
+def error_of(err: dict) -> JSONRPCException:
+    '''
+    Returns the exception for the error object of JSON-RPC response,
+    same as the one raised by IconService.
+    '''
+    return JSONRPCException(err.get('message'), err.get('code'), err.get('data'))
+
+class Batch:
+    '''
+    Collects JSON-RPC requests and sends them as a single batch request.
+    Each request method returns a future which is resolved on flush(),
+    with the value converted as the method of IconService with the name.
+    Used as a context manager, it flushes on exit.
+
+        with svc.batch() as batch:
+            balance = batch.get_balance(addr)
+            stake = batch.call(CallBuilder(...).build())
+        print(balance.result(), stake.result())
+    '''
+    def __init__(self, url: str) -> None:
+        self.__url = url
+        self.__requests: List[Tuple[dict, Optional[Callable], futures.Future]] = []
+
+    def request(self, method: str, params: dict = None, convert: Callable[[Any], Any] = None) -> futures.Future:
+        req = {
+            'jsonrpc': '2.0',
+            'id': len(self.__requests)+1,
+            'method': method,
+        }
+        if params is not None:
+            req['params'] = params
+        ft = futures.Future()
+        self.__requests.append((req, convert, ft))
+        return ft
+
+    def call(self, call: Call) -> futures.Future:
+        return self.request('icx_call', call_params(call))
+
+    def get_balance(self, address: str, height: int = None) -> futures.Future:
+        params = { 'address': address }
+        if height is not None:
+            params['height'] = hex(height)
+        return self.request('icx_getBalance', params, lambda v: int(v, 0))
+
+    def get_score_status(self, address: str, height: int = None) -> futures.Future:
+        params = { 'address': address }
+        if height is not None:
+            params['height'] = hex(height)
+        return self.request('icx_getScoreStatus', params)
+
+    def get_transaction(self, tx_hash: str) -> futures.Future:
+        return self.request('icx_getTransactionByHash', { 'txHash': tx_hash },
+                            lambda v: convert(v, TRANSACTION))
+
+    def flush(self):
+        reqs, self.__requests = self.__requests, []
+        if len(reqs) == 0:
+            return
+        try:
+            resp = transport.post(self.__url, json=[ req for req, _, _ in reqs ])
+            try:
+                results = resp.json()
+            except ValueError:
+                raise HTTPError(resp.text, resp.status_code)
+            if not isinstance(results, list):
+                if isinstance(results, dict) and 'error' in results:
+                    raise error_of(results['error'])
+                raise HTTPError(resp.text, resp.status_code)
+        except BaseException as exc:
+            for _, _, ft in reqs:
+                ft.set_exception(exc)
+            raise
+
+        id_to_result = { res.get('id'): res for res in results }
+        for req, to_value, ft in reqs:
+            res = id_to_result.get(req['id'])
+            if res is None:
+                ft.set_exception(JSONRPCException(f'NoResponse(id={req["id"]})'))
+            elif 'error' in res:
+                ft.set_exception(error_of(res['error']))
+            else:
+                try:
+                    value = res.get('result')
+                    ft.set_result(to_value(value) if to_value is not None else value)
+                except BaseException as exc:
+                    ft.set_exception(exc)
+
+    def cancel(self):
+        reqs, self.__requests = self.__requests, []
+        for _, _, ft in reqs:
+            ft.cancel()
+
+    def __enter__(self) -> 'Batch':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.cancel()
+
+class SessionHTTPProvider(HTTPProvider):
+    '''
+    HTTPProvider sending requests through the shared session of the endpoint,
+    so connections are reused across requests.
+    '''
+    def _make_post_request(self, request_url: str, data: dict, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', transport.get_timeout())
+        return transport.get_session(request_url).post(url=request_url, data=json.dumps(data), **kwargs)
+
 class Service(IconService):
-    def __init__(self, provider: HTTPProvider, nid: int):
+    def __init__(self, provider: HTTPProvider, nid: int, cache: BlockCache = None, url: str = None):
         super().__init__(provider)
         self.__nid = nid
+        self.__cache = cache
+        self.__url = url
+        self.__calls: Dict[str, Tuple[Optional[float], Any]] = {}
+        self.__calls_lock = threading.Lock()
+        self.__call_hits = 0
+        self.__call_misses = 0
 
     @property
     def nid(self) -> int:
         return self.__nid
 
+    @property
+    def url(self) -> Optional[str]:
+        return self.__url
+
+    def batch(self) -> Batch:
+        if self.__url is None:
+            raise Exception('NoURLForBatch')
+        return Batch(self.__url)
+
+    @property
+    def cache(self) -> Optional[BlockCache]:
+        return self.__cache
+
+    def __cached(self, kind: str, key: any, get_value: Callable[[], any],
+                 cacheable: Callable[[any], bool] = None) -> any:
+        value = self.__cache.get(self.__nid, kind, key, MISSING)
+        if value is MISSING:
+            value = get_value()
+            if cacheable is None or cacheable(value):
+                self.__cache.put(self.__nid, kind, key, value)
+        return value
+
+    def get_block(self, value: Union[int, str], full_response: bool = False, **kwargs) -> dict:
+        if self.__cache is None or full_response or value == 'latest':
+            return super().get_block(value, full_response, **kwargs)
+        return self.__cached('block', value,
+            lambda: super(Service, self).get_block(value, full_response, **kwargs))
+
+    def get_block_header_by_height(self, height: int) -> str:
+        if self.__cache is None:
+            return super().get_block_header_by_height(height)
+        return self.__cached('header', height,
+            lambda: super(Service, self).get_block_header_by_height(height))
+
+    def get_votes_by_height(self, height: int) -> str:
+        if self.__cache is None:
+            return super().get_votes_by_height(height)
+        return self.__cached('votes', height,
+            lambda: super(Service, self).get_votes_by_height(height))
+
+    def get_data_by_hash(self, _hash: str) -> str:
+        if self.__cache is None:
+            return super().get_data_by_hash(_hash)
+        return self.__cached('data', _hash,
+            lambda: super(Service, self).get_data_by_hash(_hash))
+
+    def get_score_status(self, address: str, height: int = None, full_response: bool = False) -> dict:
+        if self.__cache is None or full_response or height is None:
+            return super().get_score_status(address, height, full_response)
+        return self.__cached('score', f'{address}@{height}',
+            lambda: super(Service, self).get_score_status(address, height, full_response))
+
+    def get_transaction(self, tx_hash: str, full_response: bool = False) -> dict:
+        if self.__cache is None or full_response:
+            return super().get_transaction(tx_hash, full_response)
+        return self.__cached('tx', tx_hash,
+            lambda: super(Service, self).get_transaction(tx_hash, full_response),
+            lambda tx: tx.get('blockHeight') is not None)
+
+    @property
+    def call_stats(self) -> Dict[str, int]:
+        return { 'hits': self.__call_hits, 'misses': self.__call_misses }
+
+    def call(self, call: Call, full_response: bool = False) -> Any:
+        '''
+        Same as IconService.call(), but results are memoized by the request.
+        Results at a height are kept (also in the cache if it's set), and
+        results for the latest state are reused for CALL_TTL seconds.
+        '''
+        if full_response:
+            return super().call(call, full_response)
+        params = call_params(call)
+        key = json.dumps(params, sort_keys=True, separators=(',', ':'))
+        pinned = 'height' in params
+        now = time.monotonic()
+        with self.__calls_lock:
+            entry = self.__calls.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self.__call_hits += 1
+                return copy.deepcopy(entry[1])
+            self.__call_misses += 1
+
+        if pinned and self.__cache is not None:
+            value = self.__cached('call', key, lambda: super(Service, self).call(call))
+        else:
+            value = super().call(call)
+        with self.__calls_lock:
+            self.__calls[key] = (None if pinned else time.monotonic()+CALL_TTL, value)
+        return copy.deepcopy(value)
+
+    def __invalidate_calls(self):
+        with self.__calls_lock:
+            for key in [ k for k, v in self.__calls.items() if v[0] is not None ]:
+                del self.__calls[key]
+
+    def send_transaction(self, signed_transaction: SignedTransaction, full_response: bool = False) -> Any:
+        try:
+            return super().send_transaction(signed_transaction, full_response)
+        finally:
+            self.__invalidate_calls()
+
+    def send_transaction_and_wait(self, signed_transaction: SignedTransaction, full_response: bool = False) -> Any:
+        try:
+            return super().send_transaction_and_wait(signed_transaction, full_response)
+        finally:
+            self.__invalidate_calls()
+
     def send_transaction_and_pull(self, tx: SignedTransaction) -> any:
         try:
             result = self.send_transaction_and_wait(tx)
@@ -75,9 +334,11 @@ class Service(IconService):
 
 cached_service = {}
 default_net = None
+default_cache = None
 def get_instance(url: str = None, nid: int = None) -> Service:
     global cached_service
     global default_net
+    global default_cache
 
     if url is None:
         if default_net is not None:
@@ -87,10 +348,15 @@ def get_instance(url: str = None, nid: int = None) -> Service:
             nid = int(os.getenv('GOLOOP_RPC_NID', MAINNET_NID), 0)
 
     if url not in cached_service:
-        service = Service(HTTPProvider(url), nid)
+        cache = default_cache if nid is not None else None
+        service = Service(SessionHTTPProvider(url), nid, cache, url)
         cached_service[url] = service
     return cached_service[url]
 
 def set_default(url: str = None, nid: int = None):
     global default_net
-    default_net = (url, nid)
\ No newline at end of file
+    default_net = (url, nid)
+
+def set_cache(cache: Optional[BlockCache]):
+    global default_cache
+    default_cache = cache
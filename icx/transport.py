@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import socket
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_KEEPALIVE = 30
+
+class KeepAliveAdapter(HTTPAdapter):
+    '''
+    HTTPAdapter enabling TCP keep-alive probes on pooled connections,
+    so idle connections to the endpoint survive between requests.
+    '''
+    def __init__(self, keepalive: int = DEFAULT_KEEPALIVE, **kwargs) -> None:
+        self.__keepalive = keepalive
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.__keepalive > 0:
+            options = list(HTTPConnection.default_socket_options)
+            options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.__keepalive))
+            if hasattr(socket, 'TCP_KEEPINTVL'):
+                options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, self.__keepalive//3)))
+            kwargs['socket_options'] = options
+        super().init_poolmanager(*args, **kwargs)
+
+options = {
+    'pool_size': DEFAULT_POOL_SIZE,
+    'timeout': DEFAULT_TIMEOUT,
+    'keepalive': DEFAULT_KEEPALIVE,
+}
+
+sessions: Dict[str, requests.Session] = {}
+sessions_lock = threading.Lock()
+
+def configure(*, pool_size: Optional[int] = None, timeout: Optional[float] = None, keepalive: Optional[int] = None):
+    '''
+    Configure the transport. It applies to sessions created after the call.
+    '''
+    for key, value in (('pool_size', pool_size), ('timeout', timeout), ('keepalive', keepalive)):
+        if value is not None:
+            options[key] = value
+
+def get_timeout() -> float:
+    return options['timeout']
+
+def endpoint_of(url: str) -> str:
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}'
+
+def get_session(url: str) -> requests.Session:
+    '''
+    Returns the shared session for the endpoint (scheme and host) of the URL.
+    '''
+    endpoint = endpoint_of(url)
+    with sessions_lock:
+        session = sessions.get(endpoint)
+        if session is None:
+            session = requests.Session()
+            adapter = KeepAliveAdapter(options['keepalive'],
+                                       pool_connections=1,
+                                       pool_maxsize=options['pool_size'])
+            session.mount(endpoint, adapter)
+            sessions[endpoint] = session
+    return session
+
+def post(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault('timeout', options['timeout'])
+    return get_session(url).post(url, **kwargs)
+
+def get(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault('timeout', options['timeout'])
+    return get_session(url).get(url, **kwargs)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+import asyncio
+import os
+import sqlite3
+import sys
+from os import path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import click
+
+from . import asyncservice, service
+from .util import INT
+
+INDEX_FILE = 'txindex.db'
+
+# number of blocks stored in a transaction, so it resumes from there
+COMMIT_BLOCKS = 1000
+
+def default_index_file() -> str:
+    return path.join(click.get_app_dir('ICX'), INDEX_FILE)
+
+def get_method(tx: dict) -> Optional[str]:
+    data = tx.get('data')
+    return data.get('method') if type(data) is dict else None
+
+def to_value(value: any) -> Optional[str]:
+    if value is None:
+        return None
+    return hex(value) if isinstance(value, int) else str(value)
+
+def from_value(value: str) -> any:
+    '''
+    Returns the value stored by to_value(), as it's in the block.
+    '''
+    try:
+        return int(value, 0)
+    except ValueError:
+        return value
+
+class TxIndex:
+    '''
+    Local index of transactions (height, hash, from, to, dataType, method,
+    value and version) of a contiguous range of blocks for each network.
+    It's extended from the last indexed height.
+    '''
+    def __init__(self, file: str) -> None:
+        self.__file = file
+        self.__conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def file(self) -> str:
+        return self.__file
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__conn is None:
+            base_dir = os.path.dirname(self.__file)
+            if base_dir:
+                os.makedirs(base_dir, exist_ok=True, mode=0o700)
+            conn = sqlite3.connect(self.__file)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS txs (
+                nid INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                idx INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                from_addr TEXT,
+                to_addr TEXT,
+                data_type TEXT,
+                method TEXT,
+                value TEXT,
+                version INTEGER,
+                PRIMARY KEY (nid, height, idx))''')
+            conn.execute('CREATE INDEX IF NOT EXISTS txs_from ON txs (nid, from_addr, height)')
+            conn.execute('CREATE INDEX IF NOT EXISTS txs_to ON txs (nid, to_addr, height)')
+            conn.execute('''CREATE TABLE IF NOT EXISTS ranges (
+                nid INTEGER NOT NULL PRIMARY KEY,
+                first INTEGER NOT NULL,
+                last INTEGER NOT NULL)''')
+            conn.commit()
+            self.__conn = conn
+        return self.__conn
+
+    def close(self):
+        if self.__conn is not None:
+            self.__conn.close()
+            self.__conn = None
+
+    def get_range(self, nid: int) -> Optional[Tuple[int, int]]:
+        '''
+        Returns (first, last) height of indexed blocks
+        '''
+        row = self.__connect().execute('SELECT first, last FROM ranges WHERE nid=?', (nid,)).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def add_blocks(self, nid: int, blocks: Iterable[dict]):
+        '''
+        Store transactions of the blocks. Blocks should follow the last
+        indexed block. They are stored with the range in a transaction.
+        '''
+        conn = self.__connect()
+        rows = []
+        first, last = None, None
+        for blk in blocks:
+            height = blk['height']
+            for idx, tx in enumerate(blk['confirmed_transaction_list']):
+                rows.append((nid, height, idx,
+                             tx.get('txHash', tx.get('tx_hash')),
+                             tx.get('from'), tx.get('to'),
+                             tx.get('dataType'), get_method(tx),
+                             to_value(tx.get('value')),
+                             tx.get('version')))
+            first = height if first is None else first
+            last = height
+        if last is None:
+            return
+        current = self.get_range(nid)
+        if current is not None and current[1]+1 != first:
+            raise Exception(f'InvalidHeight(last={current[1]},height={first})')
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO txs VALUES (?,?,?,?,?,?,?,?,?,?)', rows)
+            conn.execute('INSERT OR REPLACE INTO ranges VALUES (?,?,?)',
+                         (nid, first if current is None else current[0], last))
+
+    def query(self, nid: int, start: int, end: int, *,
+              receivers: List[str] = (), senders: List[str] = (), addresses: List[str] = (),
+              reverse: bool = False) -> Iterator[Tuple[int, dict]]:
+        '''
+        Returns iterator of (height, tx) in the height range (inclusive)
+        matching the address conditions. Returned transactions have
+        only the indexed fields.
+        '''
+        where = [ 'nid=?', 'height BETWEEN ? AND ?' ]
+        params = [ nid, start, end ]
+        def in_clause(column: str, values: List[str]) -> str:
+            params.extend(values)
+            return f'{column} IN ({",".join("?"*len(values))})'
+        if len(receivers) > 0:
+            where.append(in_clause('to_addr', receivers))
+        if len(senders) > 0:
+            where.append(in_clause('from_addr', senders))
+        if len(addresses) > 0:
+            where.append(f'({in_clause("from_addr", addresses)} OR {in_clause("to_addr", addresses)})')
+        order = 'DESC' if reverse else 'ASC'
+        sql = (f'SELECT height, hash, from_addr, to_addr, data_type, method, value, version FROM txs '
+               f'WHERE {" AND ".join(where)} ORDER BY height {order}, idx ASC')
+        for height, hash, from_addr, to_addr, data_type, method, value, version in self.__connect().execute(sql, params):
+            tx = { 'txHash': hash }
+            for key, v in (('from', from_addr), ('to', to_addr), ('dataType', data_type),
+                           ('value', None if value is None else from_value(value)), ('version', version)):
+                if v is not None:
+                    tx[key] = v
+            if method is not None:
+                tx['data'] = { 'method': method }
+            yield height, tx
+
+async def index_blocks(svc: service.Service, index: TxIndex, start: int, end: int, concurrency: int):
+    '''
+    Fetch blocks of the range on the event loop, and store them for each
+    COMMIT_BLOCKS blocks.
+    '''
+    async with asyncservice.AsyncService.from_service(svc, concurrency=concurrency) as asvc:
+        for height in range(start, end+1, COMMIT_BLOCKS):
+            heights = range(height, min(height+COMMIT_BLOCKS, end+1))
+            blocks = await asyncservice.gather(*[ asvc.get_block(h) for h in heights ])
+            index.add_blocks(svc.nid, blocks)
+            click.secho(f'\033[K> Indexed height={heights[-1]}\r', nl=False, fg='bright_black', file=sys.stderr)
+
+@click.command('txindex')
+@click.option('--start', type=INT, default=None, help='Height to start indexing (only for the empty index)')
+@click.option('--end', type=INT, default=None, help='Last height to index (default: latest)')
+@click.option('--concurrency', type=click.INT, default=asyncservice.DEFAULT_CONCURRENCY, help='Number of blocks to fetch concurrently')
+@click.option('--db', 'file', metavar='<file>', default=None, help=f'Index file (default: {INDEX_FILE} in the config directory)')
+def build_index(start: int = None, end: int = None, concurrency: int = asyncservice.DEFAULT_CONCURRENCY, file: str = None):
+    '''
+    Build local transaction index, used by "txscan --index"
+
+    It continues from the last indexed height.
+    '''
+    svc = service.get_instance()
+    index = TxIndex(file or default_index_file())
+    current = index.get_range(svc.nid)
+    if current is not None:
+        start = current[1]+1
+    elif start is None:
+        raise click.UsageError('--start is required for the empty index')
+    if end is None:
+        end = svc.get_block('latest')['height']
+    if start > end:
+        click.secho(f'Already indexed to height={current[1]}', fg='bright_black', file=sys.stderr)
+        return
+
+    click.secho(f'Indexing height={start}..{end} to {index.file}', fg='bright_black', file=sys.stderr)
+    asyncio.run(index_blocks(svc, index, start, end, concurrency))
+    click.secho('\033[K', nl=False, file=sys.stderr)
+    first, last = index.get_range(svc.nid)
+    click.secho(f'Indexed height={first}..{last}', fg='bright_black', file=sys.stderr)
@@ -1,11 +1,23 @@
 #!/usr/bin/env python3
 
-from typing import Iterable, List, Union
+import abc
+import base64
+import csv
+import itertools
+import json
+import sys
+import time
+from typing import Callable, Iterable, List, Optional, Tuple, Union
 
 import click
+from iconsdk.monitor import BlockMonitorSpec
 
-from . import service
+from . import blocktime, rlp, service
+from .blockvotes import BLOCK
 from .cui import Column, RowPrinter
+from .logsbloom import LogsBloom, address_bits, event_log_bits
+from .prefetch import DEFAULT_THREADS, ordered_map
+from .txindex import TxIndex, default_index_file, get_method
 from .util import *
 
 FULL_ADDR_LEN=42
@@ -47,7 +59,79 @@ def show_txs(printer: RowPrinter, height: int, txs: list, reversed: bool, **kwar
         printer.print_data(title, tx, **kwargs)
         title = ''
 
+FLUSH_INTERVAL = 1.0
+FLUSH_SIZE = 64*1024
+
+class RecordWriter(metaclass=abc.ABCMeta):
+    '''
+    Buffered writer of matched transactions (one record for each).
+    Buffered records are written when it reaches FLUSH_SIZE or
+    FLUSH_INTERVAL seconds passed since the last flush.
+    '''
+    def __init__(self, out = None, interval: float = FLUSH_INTERVAL) -> None:
+        self.__out = sys.stdout if out is None else out
+        self.__interval = interval
+        self.__buffer: List[str] = []
+        self.__size = 0
+        self.__flushed = time.monotonic()
+
+    def write(self, data: str):
+        self.__buffer.append(data)
+        self.__size += len(data)
+
+    @abc.abstractmethod
+    def write_tx(self, height: int, tx: dict):
+        pass
+
+    def write_txs(self, height: int, txs: list, reverse: bool):
+        for tx in (reversed(txs) if reverse else txs):
+            self.write_tx(height, tx)
+        self.poll()
+
+    def poll(self):
+        if self.__size >= FLUSH_SIZE or time.monotonic() - self.__flushed >= self.__interval:
+            self.flush()
+
+    def flush(self):
+        if len(self.__buffer) > 0:
+            self.__out.write(''.join(self.__buffer))
+            self.__buffer.clear()
+            self.__size = 0
+        self.__out.flush()
+        self.__flushed = time.monotonic()
+
+class NDJSONWriter(RecordWriter):
+    def write_tx(self, height: int, tx: dict):
+        self.write(json.dumps({ 'height': height, **tx }, separators=(',', ':'), default=str)+'\n')
+
+CSV_FIELDS = [ 'height', 'txHash', 'from', 'to', 'dataType', 'method', 'value' ]
+
+class CSVWriter(RecordWriter):
+    def __init__(self, out = None, interval: float = FLUSH_INTERVAL) -> None:
+        super().__init__(out, interval)
+        self.__csv = csv.writer(self, lineterminator='\n')
+        self.__csv.writerow(CSV_FIELDS)
+
+    def write_tx(self, height: int, tx: dict):
+        self.__csv.writerow((
+            height,
+            tx.get('txHash', tx.get('tx_hash')),
+            tx.get('from'),
+            tx.get('to'),
+            tx.get('dataType'),
+            get_method(tx),
+            tx.get('value'),
+        ))
+
+OUTPUT_WRITERS = {
+    'ndjson': NDJSONWriter,
+    'csv': CSVWriter,
+}
+
 def merge_filters(filter: list):
+    if len(filter) == 1:
+        return filter[0]
+    filter = tuple(filter)
     def func(tx:dict ) -> bool:
         for f in filter:
             if not f(tx):
@@ -55,6 +139,38 @@ def merge_filters(filter: list):
         return True
     return func
 
+def compile_filter(*, nobase: bool = False, receivers: Iterable[str] = (),
+                   senders: Iterable[str] = (), addresses: Iterable[str] = (),
+                   methods: Iterable[str] = (), data_types: Iterable[str] = (),
+                   version: int = None) -> Optional[Callable[[dict], bool]]:
+    '''
+    Returns a function checking the transaction matches all the conditions,
+    or None if there is no condition. Addresses should be normalized.
+    '''
+    tx_filters = []
+    if nobase:
+        tx_filters.append(lambda tx: tx.get('dataType') != 'base')
+    if len(receivers) > 0:
+        receivers = frozenset(receivers)
+        tx_filters.append(lambda tx: tx.get('to') in receivers)
+    if len(senders) > 0:
+        senders = frozenset(senders)
+        tx_filters.append(lambda tx: tx.get('from') in senders)
+    if len(addresses) > 0:
+        addresses = frozenset(addresses)
+        tx_filters.append(lambda tx: tx.get('from') in addresses or tx.get('to') in addresses)
+    if len(methods) > 0:
+        methods = frozenset(methods)
+        tx_filters.append(lambda tx: get_method(tx) in methods)
+    if len(data_types) > 0:
+        data_types = frozenset(data_types)
+        tx_filters.append(lambda tx: tx.get('dataType', 'transfer') in data_types)
+    if version is not None:
+        tx_filters.append(lambda tx: tx.get('version', 2) == version)
+    if len(tx_filters) == 0:
+        return None
+    return merge_filters(tx_filters)
+
 def expand_comma(args: Iterable[str]) -> List[str]:
     items = []
     for arg in args:
@@ -64,12 +180,129 @@ def expand_comma(args: Iterable[str]) -> List[str]:
 
 TC_CLEAR = '\033[K'
 
+def next_heights(height: int, forward: bool) -> Iterable[int]:
+    if forward:
+        while True:
+            height += 1
+            yield height
+    else:
+        while height > 0:
+            height -= 1
+            yield height
+
+def iterate_blocks(svc: service.Service, id: Union[int,str], forward: bool,
+                   threads: int = DEFAULT_THREADS, window: int = None) -> Iterable[dict]:
+    blk = svc.get_block(id)
+    yield blk
+    yield from ordered_map(svc.get_block, next_heights(blk['height'], forward),
+                           threads=threads, window=window)
+
+# number of transactions of a block to check event logs with the bloom
+BLOOM_VERIFY_TXS = 8
+
+def verify_bloom(svc: service.Service, blk: dict, bloom: LogsBloom) -> bool:
+    '''
+    Check the bloom (of the next block header) has bits of event logs in the
+    first BLOOM_VERIFY_TXS transactions of the block. It returns whether
+    there were event logs to check.
+    '''
+    verified = False
+    for tx in blk['confirmed_transaction_list'][:BLOOM_VERIFY_TXS]:
+        result = svc.get_transaction_result(tx.get('txHash', tx.get('tx_hash')))
+        for log in result.get('eventLogs', []):
+            if not bloom.contains_all(event_log_bits(log)):
+                raise click.ClickException(
+                    f'Logs bloom of height={blk["height"]+1} does not have the event of '
+                    f'{log["scoreAddress"]} (unknown bloom layout, scan without --bloom)')
+            verified = True
+    return verified
+
+def bloom_fetcher(svc: service.Service, contracts: Iterable[str]) -> Callable[[int], Tuple[int, Optional[dict]]]:
+    '''
+    Returns a function returning (height, block) for the height, but
+    the block is None if logs bloom of the next block header shows that
+    none of the contracts emitted events in the block.
+
+    Blocks are not skipped until the bloom is verified with event logs
+    of a fetched block, so an unexpected layout fails instead of dropping
+    matching blocks.
+    '''
+    bits_list = [ address_bits(addr) for addr in contracts ]
+    verified = False
+    def fetch(height: int) -> Tuple[int, Optional[dict]]:
+        nonlocal verified
+        try:
+            hdr = rlp.decode_bytes(base64.b64decode(svc.get_block_header_by_height(height+1)))
+        except blocktime.HEADER_ERRORS:
+            return height, svc.get_block(height)
+        bloom = LogsBloom(hdr[BLOCK.LOGS_BLOOM])
+        if not verified:
+            blk = svc.get_block(height)
+            if verify_bloom(svc, blk, bloom):
+                verified = True
+            return height, blk
+        if not bloom.contains_any(bits_list):
+            return height, None
+        return height, svc.get_block(height)
+    return fetch
+
+def follow_blocks(svc: service.Service, height: int, fetch: Callable[[int], Tuple[int, Optional[dict]]],
+                  threads: int = DEFAULT_THREADS, window: int = None) -> Iterable[Tuple[int, Optional[dict]]]:
+    '''
+    Returns fetch(height) for heights after the height. Existing blocks are
+    prefetched, then new blocks are notified by the block monitor.
+    '''
+    while True:
+        last = svc.get_block('latest')['height']
+        if last - height <= threads:
+            break
+        yield from ordered_map(fetch, range(height+1, last+1), threads=threads, window=window)
+        height = last
+
+    monitor = svc.monitor(BlockMonitorSpec(height+1))
+    try:
+        while True:
+            obj = monitor.read()
+            if 'height' not in obj:
+                raise click.ClickException(f'Block monitor failed ({obj})')
+            yield fetch(int(obj['height'], 0))
+    finally:
+        monitor.close()
+
+def iterate_index(index: TxIndex, nid: int, id: Union[int,str], forward: bool, *,
+                  receivers: List[str], senders: List[str], addresses: List[str]) -> Iterable[Tuple[int, List[dict]]]:
+    indexed = index.get_range(nid)
+    if indexed is None:
+        raise click.ClickException(f'No indexed blocks for nid={nid} in {index.file} (use "txindex")')
+    first, last = indexed
+    if id == 'latest':
+        height = last
+    elif isinstance(id, int):
+        height = id
+    else:
+        raise click.BadParameter('only height is allowed with --index', param_hint='block')
+    start, end = (height, last) if forward else (first, height)
+    click.secho(f'Query index for height={start}..{end}', fg='bright_black', file=sys.stderr)
+    txs = index.query(nid, start, end, receivers=receivers, senders=senders,
+                      addresses=addresses, reverse=not forward)
+    for height, items in itertools.groupby(txs, key=lambda x: x[0]):
+        yield height, [ tx for _, tx in items ]
+
+def iterate_blocks_with_bloom(svc: service.Service, id: Union[int,str], forward: bool,
+                              contracts: Iterable[str], threads: int = DEFAULT_THREADS,
+                              window: int = None) -> Iterable[Tuple[int, Optional[dict]]]:
+    blk = svc.get_block(id)
+    yield blk['height'], blk
+    yield from ordered_map(bloom_fetcher(svc, contracts), next_heights(blk['height'], forward),
+                           threads=threads, window=window)
+
 @click.command()
 @click.argument('block', default="latest")
 @click.option('--column', '-c', 'columns', multiple=True)
 #@click.argument('columns', nargs=-1)
 #@click.option('--block', '--height', 'block', default='latest')
 @click.option('--forward', type=bool, is_flag=True, default=False)
+@click.option('--follow', '-f', is_flag=True, default=False, help='Scan forward, then follow new blocks with the block monitor')
 @click.option('--nobase', type=bool, is_flag=True, default=False)
 @click.option('--to', 'receivers', default=None, multiple=True)
 @click.option('--from', 'senders', default=None, multiple=True)
@@ -77,39 +310,55 @@ TC_CLEAR = '\033[K'
 @click.option('--method', '-m', 'methods', default=None, multiple=True)
 @click.option('--data_type', '-t', 'data_types', default=None, multiple=True)
 @click.option('--version', type=click.INT, default=None)
-def scan(columns: List[str], block, forward, nobase, receivers, senders, addresses, methods, data_types, version: int = None):
+@click.option('--threads', type=click.INT, default=DEFAULT_THREADS, help='Number of blocks to fetch concurrently')
+@click.option('--window', type=click.INT, default=None, help='Number of blocks to prefetch (default: 4*threads)')
+@click.option('--bloom', is_flag=True, default=False, help='Skip blocks where the contracts (--to, --address) emitted no events')
+@click.option('--index', 'use_index', is_flag=True, default=False, help='Query the local transaction index built by "txindex"')
+@click.option('--db', 'index_file', metavar='<file>', default=None, help='Transaction index file for --index')
+@click.option('--output', '-o', type=click.Choice(['table']+list(OUTPUT_WRITERS.keys())), default='table',
+              help='Output format (ndjson and csv write one record for each transaction)')
+def scan(columns: List[str], block, forward, follow, nobase, receivers, senders, addresses, methods, data_types, version: int = None,
+         threads: int = DEFAULT_THREADS, window: int = None, bloom: bool = False,
+         use_index: bool = False, index_file: str = None, output: str = 'table'):
     """Scanning transactions
 
     COLUMNS is list of columns to display. Some of following values
     can be used.
     (id, from, from..., type, method, to, to..., value)
+
+    With "--bloom", it checks logs bloom of block headers, and fetches
+    only the blocks where the contracts given by "--to" or "--address"
+    emitted events. Transactions to the contracts without events are
+    not shown in this mode. Blocks are skipped only after the bloom is
+    verified with event logs of the fetched blocks.
+
+    With "--index", it queries the local transaction index instead of
+    fetching blocks. It only covers the indexed blocks.
+
+    With "--follow", it scans forward to the last block, then keeps
+    scanning new blocks as the block monitor notifies them.
     """
 
     svc = service.get_instance()
 
-    tx_filters = []
-    if nobase:
-        tx_filters.append(lambda tx: dict_get(tx, 'dataType') != 'base')
-    if len(receivers) > 0:
-        receivers = expand_comma(receivers)
-        receivers = tuple(map(lambda x: ensure_address(x), receivers))
-        tx_filters.append(lambda tx: dict_get(tx, 'to') in receivers )
-    if len(senders) > 0:
-        senders = expand_comma(senders)
-        senders = tuple(map(lambda x: ensure_address(x), senders))
-        tx_filters.append(lambda tx: dict_get(tx, 'from') in senders )
-    if len(addresses) > 0:
-        addresses = expand_comma(addresses)
-        addresses = tuple(map(lambda x: ensure_address(x), addresses))
-        tx_filters.append(lambda tx: dict_get(tx, 'from') in addresses or dict_get(tx,'to') in addresses )
-    if len(methods) > 0:
-        tx_filters.append(lambda tx: dict_get(tx, ['data', 'method']) in methods)
-    if len(data_types) > 0:
-        data_types = expand_comma(data_types)
-        tx_filters.append(lambda tx: dict_get(tx, 'dataType', 'transfer') in data_types)
-    if version is not None:
-        tx_filters.append(lambda tx: dict_get(tx, 'version', 2) == version)
-    tx_filter = merge_filters(tx_filters)
+    receivers = [ ensure_address(x) for x in expand_comma(receivers) ]
+    senders = [ ensure_address(x) for x in expand_comma(senders) ]
+    addresses = [ ensure_address(x) for x in expand_comma(addresses) ]
+    tx_filter = compile_filter(nobase=nobase,
+                               receivers=receivers,
+                               senders=senders,
+                               addresses=addresses,
+                               methods=expand_comma(methods),
+                               data_types=expand_comma(data_types),
+                               version=version)
+
+    contracts = [ addr for addr in receivers+addresses if addr.startswith('cx') ]
+    if bloom and len(contracts) == 0:
+        raise click.BadParameter('contract addresses are required (--to or --address)', param_hint='--bloom')
+    if follow:
+        if use_index:
+            raise click.BadOptionUsage('follow', '--follow can not be used with --index')
+        forward = True
 
     if len(columns) == 0:
         columns = DEFAULT_COLUMN_NAMES
@@ -119,19 +368,53 @@ def scan(columns: List[str], block, forward, nobase, receivers, senders, address
     column_data.insert(0, TX_HEIGHT_COLUMN)
     printer = RowPrinter(column_data)
 
-    id = ensure_block(block)
+    if window is None:
+        window = threads*4
     print_header = True
     style_index = 0
     styles = [
         {},
         { 'bg': 'bright_black'},
     ]
-    while True:
-        print(f'{TC_CLEAR}>Get Block {id}\r', end='')
-        blk = svc.get_block(id)
-        height = blk['height']
-        txs = blk['confirmed_transaction_list']
-        txs = list(filter(tx_filter, txs))
+    if use_index:
+        index = TxIndex(index_file or default_index_file())
+        blocks = iterate_index(index, svc.nid, ensure_block(block), forward,
+                               receivers=receivers, senders=senders, addresses=addresses)
+    elif follow:
+        if bloom:
+            fetch = bloom_fetcher(svc, contracts)
+        else:
+            fetch = lambda height: (height, svc.get_block(height))
+        first = svc.get_block(ensure_block(block))
+        blocks = map(lambda x: (x[0], None if x[1] is None else x[1]['confirmed_transaction_list']),
+                     itertools.chain([(first['height'], first)],
+                                     follow_blocks(svc, first['height'], fetch, threads, window)))
+    elif bloom:
+        blocks = map(lambda x: (x[0], None if x[1] is None else x[1]['confirmed_transaction_list']),
+                     iterate_blocks_with_bloom(svc, ensure_block(block), forward, contracts, threads, window))
+    else:
+        blocks = map(lambda blk: (blk['height'], blk['confirmed_transaction_list']),
+                     iterate_blocks(svc, ensure_block(block), forward, threads, window))
+    if output != 'table':
+        writer: RecordWriter = OUTPUT_WRITERS[output]()
+        try:
+            for height, txs in blocks:
+                if txs is None:
+                    writer.poll()
+                    continue
+                if tx_filter is not None:
+                    txs = list(filter(tx_filter, txs))
+                writer.write_txs(height, txs, not forward)
+        finally:
+            writer.flush()
+        return
+
+    for height, txs in blocks:
+        print(f'{TC_CLEAR}>Get Block {height}\r', end='')
+        if txs is None:
+            continue
+        if tx_filter is not None:
+            txs = list(filter(tx_filter, txs))
         if len(txs) > 0:
             if print_header:
                 printer.print_header(bold=True)
@@ -139,9 +422,3 @@ def scan(columns: List[str], block, forward, nobase, receivers, senders, address
             show_txs(printer, height, txs, not forward, **styles[style_index])
             style_index = (style_index+1)%len(styles)
             #printer.print_separater()
-        if forward:
-            id = height+1
-        elif height > 0:
-            id = height-1
-        else:
-            break
@@ -7,9 +7,8 @@ from typing import Any, Optional, Union
 
 import arrow
 import click
-import requests
 
-from . import log
+from . import log, transport
 
 CHAIN_SCORE = 'cx0000000000000000000000000000000000000000'
 GOV_SCORE = 'cx0000000000000000000000000000000000000001'
@@ -42,7 +41,7 @@ def ensure_score(addr: str) -> str:
     return addr
 
 def jsonrpc_call(url, method: str, params: Any) -> Any:
-    resp = requests.post(url, json={
+    resp = transport.post(url, json={
         "jsonrpc": "2.0",
         "id": 1001,
         "method": "icx_call",
@@ -56,7 +55,7 @@ def jsonrpc_call(url, method: str, params: Any) -> Any:
     return res['result']
 
 def rest_get(url, timeout=1.0) -> Any:
-    resp = requests.get(url, timeout=timeout)
+    resp = transport.get(url, timeout=timeout)
     if resp.status_code != 200:
         raise Exception(f"HTTPError(status={resp.status_code})")
     return resp.json()